@@ -0,0 +1,9 @@
+"""
+Benchmarks for Book Builder, run against synthetic books of several sizes:
+
+    python -m book_builder.benchmark --atoms 25 100 400
+
+Each book is generated in a temporary BOOK_PROJECT_HOME and timed in its
+own process, since book_builder.config is loaded from BOOK_PROJECT_HOME at
+import. Results are added to a JSON file and compared with the last run.
+"""
@@ -0,0 +1,114 @@
+"""
+python -m book_builder.benchmark [--atoms N ...] [--results FILE]
+"""
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import click
+
+from book_builder.benchmark.generator import generate_book
+
+package_root = Path(__file__).resolve().parent.parent.parent
+stubbed_tools = ["pandoc", "kindlegen", "zip", "kotlinc", "kotlin", "javac", "java"]
+
+
+def stub_tools(bin_dir):
+    """Stand-ins that succeed without doing anything, so no real tool is run"""
+    bin_dir.mkdir(exist_ok=True)
+    for tool in stubbed_tools:
+        stub = bin_dir / tool
+        stub.write_text(f"#!{sys.executable}\n")
+        stub.chmod(0o755)
+
+
+def time_book(home):
+    """Run the timings in a separate process, with config loaded from home"""
+    env = dict(os.environ, BOOK_PROJECT_HOME=str(home), MD_EDITOR="true", CODE_EDITOR="true",
+               PATH=f"{home / 'bin'}{os.pathsep}{os.environ.get('PATH', '')}",
+               PYTHONPATH=os.pathsep.join(
+                   filter(None, [str(package_root), os.environ.get("PYTHONPATH")])))
+    result = subprocess.run([sys.executable, "-m", "book_builder.benchmark.runner"],
+                            cwd=str(home), env=env, stdout=subprocess.PIPE,
+                            stderr=subprocess.PIPE, universal_newlines=True)
+    if result.returncode != 0:
+        sys.exit(f"Benchmark failed for {home}:\n{result.stderr}")
+    return json.loads(result.stdout.splitlines()[-1])
+
+
+def git_revision():
+    result = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=str(package_root),
+                            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                            universal_newlines=True)
+    return result.stdout.strip() if result.returncode == 0 else ""
+
+
+def compare(timings, previous):
+    """Table of this run's timings, with the change from the previous run"""
+    lines = []
+    for atoms, operations in timings.items():
+        before = previous.get(atoms, {}) if previous else {}
+        lines.append(f"\n{atoms} atoms:")
+        for name, seconds in operations.items():
+            change = ""
+            if before.get(name):
+                change = f"{(seconds - before[name]) / before[name]:+8.1%}"
+            lines.append(f"    {name:<32} {seconds:9.3f}s {change}")
+    return "\n".join(lines)
+
+
+@click.command()
+@click.option('--atoms', multiple=True, type=int, default=[25, 100, 400],
+              help='Book sizes to time (repeat for several).')
+@click.option('--listings', default=3, help='Listings per atom.')
+@click.option('--exercises', default=2, help='Exercises per atom.')
+@click.option('--crosslinks', default=1, help='Cross-links per atom.')
+@click.option('--images', default=1, help='Images per atom.')
+@click.option('--results', default="benchmark_results.json", type=click.Path(),
+              help='JSON file that each run is added to.')
+@click.option('--repeat', default=1, help='Time each book this many times and keep the fastest.')
+@click.option('--keep', is_flag=True, help="Don't delete the generated books.")
+def benchmark(atoms, listings, exercises, crosslinks, images, results, repeat, keep):
+    """Time the book tools against synthetic books of each size"""
+    results = Path(results)
+    history = json.loads(results.read_text()) if results.exists() else []
+    settings = dict(listings=listings, exercises=exercises, crosslinks=crosslinks,
+                    images=images)
+    previous = next((run["timings"] for run in reversed(history)
+                     if run["settings"] == settings), None)
+    base = Path(tempfile.mkdtemp(prefix="bb_benchmark_"))
+    timings = {}
+    try:
+        for size in atoms:
+            for run in range(repeat):
+                # A fresh copy each time, since some operations change the book:
+                home = generate_book(base / f"book{size}_{run}", size, **settings)
+                stub_tools(home / "bin")
+                click.echo(f"Timing {size} atoms in {home}")
+                fastest = timings.setdefault(str(size), {})
+                for name, seconds in time_book(home).items():
+                    fastest[name] = min(seconds, fastest.get(name, seconds))
+    finally:
+        if not keep:
+            shutil.rmtree(str(base), ignore_errors=True)
+    click.echo(compare(timings, previous))
+    history.append({
+        "date": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "repeat": repeat,
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "settings": settings,
+        "timings": timings,
+    })
+    results.write_text(json.dumps(history, indent=2))
+    click.echo(f"\nResults added to {results}")
+
+
+if __name__ == '__main__':
+    benchmark()
@@ -0,0 +1,132 @@
+"""
+Writes a synthetic book that looks like a real one to the tools: numbered
+atoms with prose, `ticked` identifiers, cross-links, images, Kotlin listings
+with sluglines and /* Output: blocks, and exercise blocks with solutions.
+Deliberately doesn't import book_builder, which needs BOOK_PROJECT_HOME.
+"""
+import random
+from pathlib import Path
+
+words = """
+the a an of to in and is it that for on with as by this be are from or
+value function class object property list map type string number result
+example code compile run program output call create return change first
+second each every other another simple complex useful common important
+variable constant parameter argument expression statement condition loop
+collection element index sequence lambda member interface package import
+""".split()
+
+# Also in the dictionary, for the headers, titles and exercise blocks:
+structure_words = """
+Atom Front Matter See Figure Exercise Exercises Solution Solutions SAMPLE END
+can be found at www AtomicKotlin com
+""".split()
+
+exercise_header = "***Exercises and solutions can be found at www.AtomicKotlin.com.***"
+
+# A 1x1 transparent PNG:
+png = bytes.fromhex(
+    "89504e470d0a1a0a0000000d4948445200000001000000010806000000"
+    "1f15c4890000000d49444154789c6360000002000001e221bc330000000049454e44ae426082")
+
+
+def sentence(rng, names):
+    chosen = rng.sample(words, rng.randint(6, 14))
+    if names and rng.random() < 0.5:
+        chosen.insert(rng.randrange(len(chosen)), f"`{rng.choice(names)}`")
+    text = " ".join(chosen)
+    return text[0].upper() + text[1:] + "."
+
+
+def listing(directory, package, name, rng):
+    value = rng.randint(1, 99)
+    return f"""\
+```kotlin
+// {directory}/{name}.kt
+package {package}
+
+class {name}(val n: Int) {{
+  fun twice() = n * 2
+}}
+
+fun main() {{
+  val item = {name}({value})
+  println(item.twice())
+}}
+/* Output:
+{value * 2}
+*/
+```"""
+
+
+def atom(n, titles, listings, exercises, crosslinks, images, rng):
+    title = titles[n]
+    directory = title.replace(" ", "")  # As the validators expect
+    package = directory.lower()
+    names = [f"Example{n}x{k}" for k in range(listings)]
+    parts = [f"# {title} {{#atom-{n}}}", ""]
+    for k in range(max(listings, 1)):
+        prose = " ".join(sentence(rng, names) for _ in range(rng.randint(3, 6)))
+        if n and k < crosslinks:
+            prose += f" See [{titles[rng.randrange(1, len(titles))]}]."
+        parts += [prose, ""]
+        if k < images:
+            parts += [f"![Figure {k}](images/{package}_{k}.png)", ""]
+        if k < listings:
+            parts += [listing(directory, package, names[k], rng), ""]
+        if k == 0:
+            parts += ["{{SAMPLE_END}}", ""]
+    if exercises:
+        parts += [exercise_header, ""]
+        for e in range(1, exercises + 1):
+            parts += [f"##### Exercise {e}", "", sentence(rng, names), "",
+                      f"> Solution {e}", "", "```kotlin",
+                      f"// {directory}/Solution{n}x{e}.kt", f"package {package}", "",
+                      "fun main() {", f"  println({e})", "}", "/* Output:", str(e), "*/",
+                      "```", ""]
+    return "\n".join(parts)
+
+
+def configuration(home):
+    extracted = home / "extracted"
+    return f"""\
+from pathlib import Path
+
+title = "Benchmark Book"
+base_name = "BenchmarkBook"
+language_name = "kotlin"
+code_ext = "kt"
+code_width = 47
+start_comment = "//"
+extracted_examples = Path({str(extracted)!r})
+sample_size = 3
+exclude_atoms = []
+web_sample_toc = Path({str(home / "web" / "toc")!r})
+web_html_book = Path({str(home / "web" / "html")!r})
+"""
+
+
+def generate_book(home, atoms=100, listings=3, exercises=2, crosslinks=1, images=1, seed=1):
+    """Write a book with the given number of atoms, and so on per atom, to home"""
+    rng = random.Random(seed)
+    home = Path(home)
+    markdown = home / "Markdown"
+    (markdown / "images").mkdir(parents=True, exist_ok=True)
+    (home / "data" / "exclusions").mkdir(parents=True, exist_ok=True)
+    (home / "extracted" / "gradle").mkdir(parents=True, exist_ok=True)
+    (home / "configuration.py").write_text(configuration(home))
+    (home / "data" / "dictionary.txt").write_text(
+        "\n".join(sorted(set(words + structure_words) | {w.capitalize() for w in words}
+                          | {w.lower() for w in structure_words})) + "\n")
+    titles = ["Front Matter"] + [f"Atom {n} {rng.choice(words).capitalize()}"
+                                 for n in range(1, atoms + 1)]
+    width = max(3, len(str(atoms)))
+    for n in range(atoms + 1):
+        name = f"{n:0{width}d}_{titles[n].replace(' ', '_')}.md"
+        (markdown / name).write_text(
+            atom(n, titles, listings if n else 0, exercises if n else 0,
+                 crosslinks, images if n else 0, rng), encoding="utf-8")
+        for k in range(images if n else 0):
+            package = titles[n].replace(" ", "").lower()
+            (markdown / "images" / f"{package}_{k}.png").write_bytes(png)
+    return home
@@ -0,0 +1,62 @@
+"""
+Times the book operations against the book in BOOK_PROJECT_HOME, printing
+{operation: seconds} as JSON on the last line. Run by the benchmark in a
+fresh process for each book, since config is loaded at import. Startup is
+timed in new interpreters, as the 'bb' command pays for it on every run.
+"""
+import contextlib
+import io
+import json
+import subprocess
+import sys
+import time
+
+import book_builder.config as config
+import book_builder.examples as examples
+import book_builder.solution_extractor as solution_extractor
+import book_builder.util as util
+import book_builder.validate as validate
+
+
+def python(code):
+    """Run code in a new interpreter, with the same environment"""
+    return lambda: subprocess.run([sys.executable, "-c", code], stdout=subprocess.DEVNULL,
+                                  check=True)
+
+
+def operations():
+    """(name, function) in the order they're run"""
+    config.epub_build_dir.mkdir(parents=True, exist_ok=True)
+    solution_extractor.exercises_repo = config.root_path / "exercises"
+    solution_extractor.exercises_repo.mkdir(exist_ok=True)
+    disassembled = config.root_path / "test"
+    return [
+        ("startup: import validate", python("import book_builder.validate")),
+        ("startup: bb --help", python(
+            "import sys; sys.argv[1:] = ['--help']; "
+            "from book_builder.scripts.book_builder import cli; cli()")),
+        ("validate all", lambda: validate.Validator.all_checks("")),
+        ("validate all (cached)", lambda: validate.Validator.all_checks("")),
+        ("extract examples", examples.extractExamples),
+        ("extract examples (unchanged)", examples.extractExamples),
+        ("create tasks for gradle",
+         lambda: examples.create_tasks_for_gradle(check_for_duplicates=False)),
+        ("combine markdown", lambda: util.combine_markdown_files(config.combined_markdown)),
+        ("disassemble markdown",
+         lambda: util.disassemble_combined_markdown_file(disassembled)),
+        ("extract exercises", solution_extractor.extract_all_exercises),
+    ]
+
+
+def main():
+    timings = {}
+    for name, operation in operations():
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            operation()
+            timings[name] = round(time.perf_counter() - start, 4)
+    print(json.dumps(timings))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,47 @@
+"""
+Lightweight client for 'bb serve'. Sends its command-line arguments to the
+running server and prints the result, so a command runs in the server's warm
+process. Deliberately imports nothing from book_builder, to start quickly.
+"""
+import json
+import os
+import socket
+import sys
+from pathlib import Path
+
+
+def connect(data):
+    """To the server's Unix domain socket, or its localhost port"""
+    socket_file = data / "bb_server.sock"
+    port_file = data / "bb_server.port"
+    if hasattr(socket, "AF_UNIX") and socket_file.exists():
+        server_file = socket_file
+        connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        address = str(socket_file)
+    elif port_file.exists():
+        server_file = port_file
+        connection = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        address = ("127.0.0.1", int(port_file.read_text()))
+    else:
+        sys.exit("No server running: start one with 'bb serve'")
+    try:
+        connection.connect(address)
+    except ConnectionRefusedError:
+        sys.exit(f"Server not responding; remove {server_file} and restart 'bb serve'")
+    return connection
+
+
+def main():
+    connection = connect(Path(os.environ['BOOK_PROJECT_HOME']) / "data")
+    with connection:
+        request = {"cwd": os.getcwd(), "args": sys.argv[1:]}
+        connection.sendall((json.dumps(request) + "\n").encode("utf-8"))
+        while True:
+            chunk = connection.recv(65536)
+            if not chunk:
+                break
+            sys.stdout.write(chunk.decode("utf-8", "replace"))
+
+
+if __name__ == '__main__':
+    main()
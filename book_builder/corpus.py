@@ -0,0 +1,132 @@
+"""
+In-memory collection of Markdown atoms, loaded once per process and shared by
+all modules. Each atom is read with a single read and its parsed pieces are
+cached; an atom is reloaded only when its modification time or size changes.
+"""
+import re
+
+import book_builder.config as config
+import book_builder.markdown_tokens as tokens
+from book_builder.line_scanner import lines_of
+
+anchor = re.compile(r"{#(.+?)}")
+anchor_tag = re.compile(r"\s*{#.+?}")
+
+
+class Atom:
+    """A single Markdown file and the information parsed from it"""
+
+    def __init__(self, path):
+        self.path = path
+        self.name = path.name
+        self.stem = path.stem
+        self.signature = None
+        self.load()
+
+    def load(self):
+        stat = self.path.stat()
+        self.signature = (stat.st_mtime_ns, stat.st_size)
+        # read_text() translates \r\n and \r line endings to \n:
+        self.text = self.path.read_text(encoding="utf-8")
+        self._lines = None
+
+    def is_stale(self):
+        stat = self.path.stat()
+        return (stat.st_mtime_ns, stat.st_size) != self.signature
+
+    @property
+    def lines(self):
+        if self._lines is None:
+            self._lines = lines_of(self.text)
+        return self._lines
+
+    @property
+    def title(self):
+        """The first line, which is the atom's header"""
+        return self.lines[0].strip() if self.lines else ""
+
+    @property
+    def heading(self):
+        """The title without any leading #'s or {#anchor}"""
+        return anchor_tag.sub("", self.title).lstrip("-#").strip()
+
+    @property
+    def anchor(self):
+        """The {#anchor} in the title, or None"""
+        match = anchor.search(self.title)
+        return match.group(1) if match else None
+
+    @property
+    def spans(self):
+        return tokens.tokenize(self.text)
+
+    def spans_of(self, kind):
+        return tokens.spans_of(kind, self.text)
+
+    @property
+    def listings(self):
+        return tokens.listings(self.text)
+
+    def __str__(self):
+        return self.name
+
+
+class Corpus:
+    """
+    The atoms in one directory. Use Corpus.of(directory) so every module
+    shares the same instance for a directory.
+    """
+    corpora = {}
+
+    @staticmethod
+    def of(directory=None):
+        directory = directory or config.markdown_dir
+        key = str(directory.resolve())
+        if key not in Corpus.corpora:
+            Corpus.corpora[key] = Corpus(directory)
+        return Corpus.corpora[key]
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.cache = {}  # Atom for each file name
+        self.names = {}  # Sorted file names for each glob pattern
+        self.directory_signature = None
+
+    def _check_directory(self):
+        """Forget the globbed names if files were added, removed or renamed"""
+        signature = self.directory.stat().st_mtime_ns
+        if signature != self.directory_signature:
+            self.directory_signature = signature
+            self.names.clear()
+
+    def file_names(self, pattern="*.md"):
+        """Sorted names of the files matching pattern, without reading them"""
+        self._check_directory()
+        if pattern not in self.names:
+            self.names[pattern] = sorted(md.name for md in self.directory.glob(pattern))
+        return self.names[pattern]
+
+    def atoms(self, pattern="*.md"):
+        """All atoms matching pattern, sorted by file name"""
+        return [self[name] for name in self.file_names(pattern)]
+
+    def __getitem__(self, name):
+        atom = self.cache.get(name)
+        if atom is None:
+            atom = self.cache[name] = Atom(self.directory / name)
+        elif atom.is_stale():
+            atom.load()
+        return atom
+
+    def text(self, path):
+        return self[path.name].text
+
+
+def atoms(pattern="*.md"):
+    """All atoms in the book's Markdown directory"""
+    return Corpus.of().atoms(pattern)
+
+
+def text_of(path):
+    """Contents of any Markdown file, through its directory's Corpus"""
+    return Corpus.of(path.parent).text(path)
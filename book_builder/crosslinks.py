@@ -0,0 +1,87 @@
+"""
+Index of cross-link targets: each atom's title, the anchor it defines and
+the file that anchor ends up in for each output format. Built once from the
+Corpus and shared by the CrossLinks validator and the HTML, Leanpub and
+zubtools link rewriting, each of which rewrites a file in one regex pass.
+"""
+import re
+from collections import namedtuple
+
+from book_builder.corpus import Corpus
+
+# [Title], as written in the Markdown:
+bare_link = re.compile(r"\[.*?\]", flags=re.DOTALL)
+# [Link text](#anchor):
+explicit_link = re.compile(r"\[([^]]+?)\]\(#(.+?)\)", flags=re.DOTALL)
+
+
+def generate_crosslink_tag(atom_title):
+    atom_title = re.sub(r"\s+", " ", atom_title)
+    title = re.sub('[`:!,()]', '', atom_title)
+    title = title.replace('&', 'and')
+    title = title.replace(' ', '-')
+    return title.lower()
+
+
+class Target(namedtuple("Target", "heading anchor stem")):
+    """Where a cross-link goes"""
+    __slots__ = ()
+
+    def href(self, output="leanpub"):
+        """Link to the target in the given output format"""
+        if output == "html":  # One file per atom
+            return f"{self.stem}.html"
+        return f"#{self.anchor}"  # A single document
+
+
+class CrossLinkIndex:
+    def __init__(self, atoms):
+        self.by_title = {}
+        self.by_anchor = {}
+        for atom in atoms:
+            target = Target(atom.heading, atom.anchor or generate_crosslink_tag(atom.heading),
+                            atom.stem)
+            # Links may use the first line as written, or just the heading:
+            self.by_title.setdefault(atom.title, target)
+            self.by_title.setdefault(atom.heading, target)
+            self.by_anchor.setdefault(target.anchor, target)
+
+    @staticmethod
+    def of(directory=None):
+        """Index of the atoms in directory (default: the book's Markdown)"""
+        return CrossLinkIndex(Corpus.of(directory).atoms())
+
+    def titles(self):
+        return sorted(self.by_title)
+
+    def resolve(self, title):
+        return self.by_title.get(title.replace("\n", " "))
+
+    def __contains__(self, title):
+        return self.resolve(title) is not None
+
+    def sub_bare(self, text, replace):
+        """
+        Replace each [Title] that resolves with replace(title, target),
+        leaving everything else alone
+        """
+        def substitute(match):
+            title = match.group(0)[1:-1].replace("\n", " ")
+            target = self.by_title.get(title)
+            return replace(title, target) if target else match.group(0)
+
+        return bare_link.sub(substitute, text)
+
+    def explicit_links(self, text):
+        """(link text, anchor, target or None) for each [Link text](#anchor)"""
+        return [(match.group(1), match.group(2), self.by_anchor.get(match.group(2)))
+                for match in explicit_link.finditer(text)]
+
+    def sub_explicit(self, text, replace):
+        """
+        Replace each [Link text](#anchor) with replace(link_text, anchor,
+        target), where target is None if no atom defines the anchor
+        """
+        return explicit_link.sub(
+            lambda match: replace(match.group(1), match.group(2),
+                                  self.by_anchor.get(match.group(2))), text)
@@ -0,0 +1,54 @@
+"""
+Safe writes for the files that validation keeps under data/. Several bb
+processes can run on the same book (a 'bb serve' alongside a 'bb validate
+all'), so each update happens under a lock on the file. The new contents
+are written to a temporary file and renamed over the old one, so an
+interrupted write never leaves a partial file.
+"""
+import contextlib
+import os
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+@contextlib.contextmanager
+def locked(path):
+    """Exclusive lock on path, held through a lock file beside it"""
+    lock_path = path.with_name(f".{path.name}.lock")
+    with open(str(lock_path), "a+b") as lock_file:
+        if fcntl:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        else:
+            lock_file.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:  # LK_LOCK only retries for about 10 seconds
+                    pass
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+            else:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def replace(path, text):
+    """Write text to path through a temporary file and a rename"""
+    temp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    temp.write_text(text, encoding="utf-8")
+    os.replace(str(temp), str(path))
+
+
+def append(path, text):
+    """Add text to the end of path in one write, waiting for other processes"""
+    with locked(path):
+        existing = path.read_text(encoding="utf-8") if path.exists() else ""
+        replace(path, existing + text)
@@ -0,0 +1,63 @@
+"""
+Finds names that occur more than once (example sluglines, extracted file
+names) in a single pass, keeping every location where each name was seen.
+"""
+from collections import Counter, defaultdict
+
+import book_builder.markdown_tokens as tokens
+from book_builder.corpus import Corpus
+
+
+class DuplicateIndex:
+    def __init__(self, items=()):
+        self.counts = Counter()
+        self.locations = defaultdict(list)
+        for name, location in items:
+            self.add(name, location)
+
+    def add(self, name, location):
+        self.counts[name] += 1
+        self.locations[name].append(location)
+
+    def by(self, key):
+        """A new index of key(name) for each name, with the same locations"""
+        return DuplicateIndex((key(name), location) for name in self.counts
+                              for location in self.locations[name])
+
+    def duplicates(self):
+        """{name: locations} for each name seen more than once, sorted by name"""
+        return {name: self.locations[name] for name in sorted(self.counts)
+                if self.counts[name] > 1}
+
+    def report(self, heading):
+        """Each duplicate and all its locations, under heading (or "" if none)"""
+        duplicates = self.duplicates()
+        if not duplicates:
+            return ""
+        return f"{heading}:\n" + "".join(
+            f"    {name}: {', '.join(str(loc) for loc in locations)}\n"
+            for name, locations in duplicates.items())
+
+    def export(self, path):
+        """Write every name with its locations to path"""
+        path.write_text("".join(
+            f"{name}\t{', '.join(str(loc) for loc in self.locations[name])}\n"
+            for name in sorted(self.counts)))
+        return f"{len(self.counts)} names written to {path}"
+
+
+def example_sluglines(directory=None):
+    """Index of each example slugline (without the '// ') to atom:line"""
+    index = DuplicateIndex()
+    for atom in Corpus.of(directory).atoms("[0-9]*_*.md"):
+        for listing in atom.listings:
+            path = tokens.slug_path(listing.code.split("\n", 1)[0], ["//"])
+            if path:
+                index.add(path, f"{atom.name}:{listing.line + 2}")
+    return index
+
+
+def file_names(directory, *patterns):
+    """Index of each file name matching patterns to its paths under directory"""
+    return DuplicateIndex((path.name, path.relative_to(directory))
+                          for pattern in patterns for path in sorted(directory.rglob(pattern)))
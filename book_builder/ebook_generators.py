@@ -3,14 +3,17 @@ Generate ebooks in different formats
 """
 import os
 import re
+import shutil
 import zipfile
 from itertools import chain
 from pathlib import Path
 
 import book_builder.config as config
+import book_builder.profiling as profiling
 from book_builder.config import BookType, epub_name
+from book_builder.jobs import Job, run_jobs
 from book_builder.util import (erase, combine_markdown_files,
-                               combine_sample_markdown,
+                               combine_sample_markdown, asset_names,
                                regenerate_ebook_build_dir, retain_files)
 
 
@@ -21,60 +24,53 @@ def pandoc_epub_command(
         ebook_type: BookType,
         highlighting=None):
     "highlighting=None uses default (pygments) for source code color syntax highlighting"
-    print(f"\tPandoc producing {output_name}")
     assert input_file.exists(), "Error: missing " + input_file.name
-    command = (
-        f"pandoc {input_file.name}"
-        f" -t epub3 -o {output_name}"
-        " -f markdown-native_divs"
-        " -f markdown+smart "
-        # ' --epub-subdirectory="" '
-        " --epub-cover-image=Cover.png " +
-        " ".join([f"--epub-embed-font={font.name}" for font in
-                  chain(config.bullets.glob("*"), config.fonts.glob("*.ttf"))])
-        + " --toc-depth=2 "
-        f'--metadata title="{title}"'
-        f" --css={config.base_name}-{ebook_type.value}.css ")
+    command = [
+        "pandoc", input_file.name,
+        "-t", "epub3", "-o", output_name,
+        "-f", "markdown-native_divs",
+        "-f", "markdown+smart",
+        # "--epub-subdirectory=",
+        "--epub-cover-image=Cover.png"] + [
+        f"--epub-embed-font={font.name}" for font in
+        chain(config.bullets.glob("*"), config.fonts.glob("*.ttf"))] + [
+        "--toc-depth=2",
+        "--metadata", f"title={title}",
+        f"--css={config.base_name}-{ebook_type.value}.css"]
     if highlighting:
-        command += f" --highlight-style={highlighting} "
-    os.system(command)
+        command.append(f"--highlight-style={highlighting}")
+    return command
 
 
-def generate_epub_files(target_dir, markdown_name, ebook_type: BookType):
+def epub_jobs(target_dir, markdown_name, ebook_type: BookType):
     """
-    Pandoc markdown to epub
+    Prepare target_dir, then return the (independent) Pandoc markdown to
+    epub jobs, each named after the epub it produces
     """
     regenerate_ebook_build_dir(target_dir, ebook_type)
     combine_markdown_files(markdown_name(
         "assembled-stripped"), strip_notes=True)
     combine_sample_markdown(markdown_name("sample"))
-    os.chdir(str(target_dir))
     print(f"Producing {target_dir.name}")
-    pandoc_epub_command(
-        markdown_name("assembled-stripped"),
-        epub_name(),
-        config.title,
-        ebook_type)
-    pandoc_epub_command(
-        markdown_name("sample"),
-        epub_name("-Sample"),
-        config.title + " Sample",
-        ebook_type)
 
+    def pandoc(input_name, output_name, title, ebook_type, highlighting=None):
+        return Job(f"{target_dir.name}/{output_name}", pandoc_epub_command(
+            markdown_name(input_name), output_name, title, ebook_type, highlighting),
+            cwd=target_dir)
+
+    jobs = [
+        pandoc("assembled-stripped", epub_name(), config.title, ebook_type),
+        pandoc("sample", epub_name("-Sample"), config.title + " Sample", ebook_type),
+    ]
     if ebook_type is BookType.MOBI:
         ebook_type = BookType.MOBIMONO
-    pandoc_epub_command(
-        markdown_name("assembled-stripped"),
-        epub_name("-monochrome"),
-        config.title,
-        ebook_type,
-        highlighting="monochrome")
-    pandoc_epub_command(
-        markdown_name("sample"),
-        epub_name("-monochrome-Sample"),
-        config.title + " Sample",
-        ebook_type,
-        highlighting="monochrome")
+    jobs += [
+        pandoc("assembled-stripped", epub_name("-monochrome"), config.title,
+               ebook_type, highlighting="monochrome"),
+        pandoc("sample", epub_name("-monochrome-Sample"), config.title + " Sample",
+               ebook_type, highlighting="monochrome"),
+    ]
+    return jobs
 
 
 def generate_epub_bug_demo_file(markdown_file):
@@ -93,13 +89,12 @@ def generate_epub_bug_demo_file(markdown_file):
         os.makedirs(target.parent)
     target.write_text(bug_demo)
     print(f"{target.name} Created")
-    os.chdir(str(config.epub_build_dir))
     print(f"Producing {config.epub_build_dir.name}")
-    pandoc_epub_command(
+    run_jobs([Job("BugDemo.epub", pandoc_epub_command(
         config.epub_md("bug-demo"),
         "BugDemo.epub",
         "Bug Demo",
-        BookType.EPUB)
+        BookType.EPUB), cwd=config.epub_build_dir)])
 
 
 def fix_for_apple(name):
@@ -108,14 +103,15 @@ def fix_for_apple(name):
     epub.close()
 
 
-def convert_to_epub():
+@profiling.profiled("target", "epub")
+def convert_to_epub(workers=0):
     """
     Pandoc markdown to epub
     """
-    generate_epub_files(config.epub_build_dir, config.epub_md, BookType.EPUB)
+    run_jobs(epub_jobs(config.epub_build_dir, config.epub_md, BookType.EPUB), workers)
     # fix_for_apple(epub_name())
     # fix_for_apple(epub_name("-Sample"))
-    retain_files(config.epub_build_dir, ["epub"])
+    retain_files(config.epub_build_dir, ["epub"], asset_names(BookType.EPUB))
     return f"\n{config.epub_build_dir.name} Completed"
 
 
@@ -143,38 +139,54 @@ def show_important_kindlegen_output(fname_stem):
             print(m)
 
 
-def convert_to_mobi():
+def mobi_jobs():
     """
-    Pandoc markdown to mobi
-    Create special EPUBs first in this directory that use AtomicKotlin-mobi.css
+    Pandoc markdown to mobi jobs. Creates special EPUBs first in
+    config.mobi_build_dir that use AtomicKotlin-mobi.css; each mobi starts
+    as soon as its epub is done.
     """
-    generate_epub_files(config.mobi_build_dir, config.mobi_md, BookType.MOBI)
-    os.chdir(str(config.mobi_build_dir))
-    for epf in Path('.').glob("*.epub"):
-        # for epf in [Path() / "AtomicKotlin-monochrome.epub"]:
-        cmd = f"kindlegen {epf.name} > {epf.stem}-kindlegen-messages.txt"
-        print(f"\tCreating {epf.stem}.mobi")
-        os.system(cmd)
-        show_important_kindlegen_output(epf.stem)
-        # os.system(f"start AtomicKotlin-monochrome.mobi")
-    retain_files(config.mobi_build_dir, ["mobi"])
+    jobs = epub_jobs(config.mobi_build_dir, config.mobi_md, BookType.MOBI)
+    for epub_job in list(jobs):
+        epf = Path(epub_job.command[epub_job.command.index("-o") + 1])
+        jobs.append(Job(
+            f"{config.mobi_build_dir.name}/{epf.stem}.mobi",
+            ["kindlegen", epf.name], cwd=config.mobi_build_dir, after=[epub_job.name],
+            ok=(0, 1),  # kindlegen returns 1 for warnings
+            log=config.mobi_build_dir / f"{epf.stem}-kindlegen-messages.txt"))
+    return jobs
+
+
+def mobi_completed():
+    for log in sorted(config.mobi_build_dir.glob("*-kindlegen-messages.txt")):
+        show_important_kindlegen_output(log.name[:-len("-kindlegen-messages.txt")])
+    retain_files(config.mobi_build_dir, ["mobi"], asset_names(BookType.MOBI))
     return f"{config.mobi_build_dir.name} Completed"
 
 
-def pandoc_docx_command(input_file, output_name, title):
-    assert input_file.exists(), f"Error: missing {input_file.name}"
-    command = (
-        "pandoc " + str(input_file.name) +
-        " -t docx -o " + output_name +
-        " -f markdown-native_divs "
-        " -f markdown+smart "
-        " --toc-depth=2 " +
-        f'--metadata title="{title}"' +
-        " --css=" + config.base_name + ".css ")
-    print(command)
-    os.system(command)
+@profiling.profiled("target", "mobi")
+def convert_to_mobi(workers=0):
+    """
+    Pandoc markdown to mobi
+    """
+    run_jobs(mobi_jobs(), workers)
+    return mobi_completed()
 
 
+def pandoc_docx_command(input_file, output_name, title):
+    assert input_file.exists(), f"Error: missing {input_file.name}"
+    command = [
+        "pandoc", str(input_file.name),
+        "-t", "docx", "-o", output_name,
+        "-f", "markdown-native_divs",
+        "-f", "markdown+smart",
+        "--toc-depth=2",
+        "--metadata", f"title={title}",
+        "--css=" + config.base_name + ".css"]
+    print(" ".join(command))
+    return command
+
+
+@profiling.profiled("target", "docx")
 def convert_to_docx():
     """
     Pandoc markdown to docx
@@ -182,32 +194,38 @@ def convert_to_docx():
     regenerate_ebook_build_dir(config.docx_build_dir, BookType.DOCX)
     combine_markdown_files(config.docx_md(
         "assembled-stripped"), strip_notes=True)
-    os.chdir(str(config.docx_build_dir))
-    pandoc_docx_command(
-        config.docx_md("assembled-stripped"), config.base_name + ".docx", config.title)
+    run_jobs([Job(config.base_name + ".docx", pandoc_docx_command(
+        config.docx_md("assembled-stripped"), config.base_name + ".docx", config.title),
+        cwd=config.docx_build_dir)])
     return f"{config.docx_build_dir.name} Completed"
 
 
-def create_release():
+@profiling.profiled("target", "release")
+def create_release(workers=0):
     "Create a release from scratch"
-    import glob
     if config.release_dir.exists():
         erase(config.release_dir)
     os.makedirs(config.release_dir)
-    convert_to_epub()
-    convert_to_mobi()
-    for src in config.built_ebooks:
-        os.system(f"cp {config.epub_build_dir / src} {config.release_dir}")
-    os.chdir(str(config.release_dir))
+    # The epub and mobi builds use separate directories, so run them together:
+    build = epub_jobs(config.epub_build_dir, config.epub_md, BookType.EPUB) + mobi_jobs()
+    run_jobs(build, workers)
+    retain_files(config.epub_build_dir, ["epub"], asset_names(BookType.EPUB))
+    print(mobi_completed())
+    with profiling.timed("copy", "ebooks to release"):
+        for src in config.built_ebooks:
+            shutil.copy(str(src), str(config.release_dir))
 
     def zzip(target_name, file_list):
         "zip utility"
         print(f"creating {target_name}.zip")
-        os.system(f"zip -m {target_name}.zip {' '.join(file_list)}")
-
-    files = glob.glob("*")
-    zzip(config.base_name, [f for f in files if not "Sample" in f])
-    zzip(config.base_name + "Sample", [f for f in files if "Sample" in f])
+        return Job(f"{target_name}.zip", ["zip", "-m", f"{target_name}.zip"] + file_list,
+                   cwd=config.release_dir)
+
+    files = sorted(f.name for f in config.release_dir.iterdir())
+    run_jobs([
+        zzip(config.base_name, [f for f in files if not "Sample" in f]),
+        zzip(config.base_name + "Sample", [f for f in files if "Sample" in f]),
+    ], workers)
     retain_files(config.release_dir, ["zip"])
     return f"\n{config.release_dir} Completed"
 
@@ -0,0 +1,304 @@
+"""
+Compiles and runs every extracted example on a pool of workers, with a
+timeout for each step. Results are cached by the example's source and the
+toolchain version, so only changed examples are rebuilt, and are written as
+a JSON pass/fail and timing report.
+"""
+import contextlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import book_builder.config as config
+import book_builder.profiling as profiling
+from book_builder.examples import main_class
+from book_builder.validation_cache import ValidationCache, digest
+
+report_path = config.data_path / "example_report.json"
+
+
+class Toolchain:
+    """Commands to compile an example into a directory and run its main()"""
+    name = ""
+    compiler = ""
+    runner = ""
+    suffix = ""
+
+    def command(self, program):
+        found = shutil.which(program)
+        if not found:
+            raise FileNotFoundError(f"Cannot find {program}")
+        return [found]
+
+    def version(self):
+        result = profiling.run(self.command(self.compiler) + ["-version"],
+                               stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                               universal_newlines=True, timeout=120)
+        return result.stdout.strip()
+
+    def compile(self, source, out_dir):
+        return self.command(self.compiler) + [str(source), "-d", str(out_dir)]
+
+    def run(self, out_dir, name):
+        return self.command(self.runner) + ["-classpath", str(out_dir), name]
+
+
+class KotlinToolchain(Toolchain):
+    name = "kotlin"
+    compiler = "kotlinc"
+    runner = "kotlin"
+    suffix = ".kt"
+
+    def compile_batch(self, sources, out_dir):
+        """Compile sources, along with the batch runner, in one invocation"""
+        runner_source = Path(out_dir) / "BatchRunner.kt"
+        runner_source.write_text(batch_runner_kt)
+        return (self.command(self.compiler) + [str(source) for source in sources] +
+                [str(runner_source), "-d", str(out_dir)])
+
+    def batch_runner(self, out_dir):
+        return self.command(self.runner) + ["-classpath", str(out_dir), "BatchRunnerKt"]
+
+
+class JavaToolchain(Toolchain):
+    name = "java"
+    compiler = "javac"
+    runner = "java"
+    suffix = ".java"
+
+    def compile(self, source, out_dir):
+        return self.command(self.compiler) + ["-d", str(out_dir), str(source)]
+
+
+class StubToolchain(KotlinToolchain):
+    """Uses stub_compiler.py in place of the real tools"""
+    name = "stub"
+
+    def command(self, program):
+        return [sys.executable, str(Path(__file__).parent / "stub_compiler.py")]
+
+    def compile(self, source, out_dir):
+        return self.command(self.compiler) + ["compile", str(source), "-d", str(out_dir)]
+
+    def run(self, out_dir, name):
+        return self.command(self.runner) + ["run", "-classpath", str(out_dir), name]
+
+    def compile_batch(self, sources, out_dir):
+        return (self.command(self.compiler) + ["compile"] +
+                [str(source) for source in sources] + ["-d", str(out_dir)])
+
+    def batch_runner(self, out_dir):
+        return self.command(self.runner) + ["serve", "-classpath", str(out_dir)]
+
+
+def toolchain_for(language, stub=False):
+    if stub:
+        return StubToolchain()
+    return {"kotlin": KotlinToolchain, "java": JavaToolchain}[language.lower()]()
+
+
+batch_runner_kt = """\
+// Runs one main() after another in a single JVM; see BatchRunner in
+// example_harness.py for the protocol.
+import java.io.ByteArrayOutputStream
+import java.io.PrintStream
+import java.lang.reflect.InvocationTargetException
+
+fun main() {
+  val protocol = System.out
+  val stderr = System.err
+  val requests = System.`in`.bufferedReader(Charsets.UTF_8)
+  while (true) {
+    val name = requests.readLine() ?: break
+    val out = ByteArrayOutputStream()
+    val err = ByteArrayOutputStream()
+    System.setOut(PrintStream(out, true, "UTF-8"))
+    System.setErr(PrintStream(err, true, "UTF-8"))
+    var status = 0
+    try {
+      Class.forName(name).getMethod("main", Array<String>::class.java)
+        .invoke(null, arrayOf<String>())
+    } catch (e: InvocationTargetException) {
+      status = 1
+      System.err.print("Exception in thread \\"main\\" ")
+      e.targetException.printStackTrace()
+    } catch (e: ReflectiveOperationException) {
+      status = 1
+      System.err.println("error: could not run main() in $name: $e")
+    }
+    System.out.flush()
+    System.err.flush()
+    System.setOut(protocol)
+    System.setErr(stderr)
+    val outBytes = out.toByteArray()
+    val errBytes = err.toByteArray()
+    protocol.write("$status ${outBytes.size} ${errBytes.size}\\n".toByteArray())
+    protocol.write(outBytes)
+    protocol.write(errBytes)
+    protocol.flush()
+  }
+}
+"""
+
+
+class BatchRunner:
+    """
+    A long-lived process that runs one main() after another, so the runtime
+    starts once instead of once per example. Protocol: send a main class
+    name and a newline; the reply is a line holding "status stdout_length
+    stderr_length", followed by that many bytes of stdout, then of stderr.
+    Any command that speaks this protocol can be used, such as the Kotlin
+    runner above or 'stub_compiler.py serve'.
+
+    Unlike separate runs, every main() shares the runtime, so static and
+    object state left by one example is seen by the next.
+    """
+
+    def __init__(self, cmd, cwd):
+        self.cmd = cmd
+        self.cwd = cwd
+        self.process = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def run(self, name):
+        """
+        Returns (status, stdout, stderr), or None if the runner died while
+        running name (because its main() called exit(), for example); the
+        next call starts a new runner.
+        """
+        if self.process is None:
+            self.process = subprocess.Popen(self.cmd, cwd=str(self.cwd),
+                                            stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        try:
+            self.process.stdin.write(name.encode("utf-8") + b"\n")
+            self.process.stdin.flush()
+            status, out_length, err_length = map(int, self.process.stdout.readline().split())
+            out = self.process.stdout.read(out_length)
+            err = self.process.stdout.read(err_length)
+        except (OSError, ValueError):
+            self.close()
+            return None
+        return status, out.decode("utf-8", "replace"), err.decode("utf-8", "replace")
+
+    def close(self):
+        if self.process is not None:
+            with contextlib.suppress(OSError):
+                self.process.stdin.close()
+            self.process.wait()
+            self.process = None
+
+
+class ResultCache(ValidationCache):
+    """Entries are stored under "example_path:toolchain_name" """
+    path = config.data_path / "example_results.json"
+
+
+def execute(cmd, cwd, timeout):
+    """Returns (returncode, stdout, stderr, seconds); returncode is None on timeout"""
+    start = time.time()
+    try:
+        result = profiling.run(cmd, cwd=str(cwd), stdout=subprocess.PIPE,
+                               stderr=subprocess.PIPE, timeout=timeout)
+        returncode, out, err = result.returncode, result.stdout, result.stderr
+    except subprocess.TimeoutExpired as e:
+        returncode, out, err = None, e.stdout or b"", e.stderr or b""
+    return (returncode, out.decode("utf-8", "replace"),
+            err.decode("utf-8", "replace"), round(time.time() - start, 3))
+
+
+def test_example(source, toolchain, timeout):
+    """Compile source and, if it has a main(), run it"""
+    result = {"status": "passed", "compile_seconds": 0, "run_seconds": 0,
+              "output": "", "errors": ""}
+    code = source.read_text()
+    with tempfile.TemporaryDirectory() as out_dir:
+        returncode, _, err, result["compile_seconds"] = execute(
+            toolchain.compile(source, out_dir), source.parent, timeout)
+        result["errors"] = err
+        if returncode != 0:
+            result["status"] = "compile_timeout" if returncode is None else "compile_error"
+            return result
+        if "main(" not in code:
+            return result
+        returncode, out, err, result["run_seconds"] = execute(
+            toolchain.run(out_dir, main_class(source, code)), source.parent, timeout)
+        result["output"] = out
+        result["errors"] += err
+        if returncode != 0:
+            result["status"] = "run_timeout" if returncode is None else "run_error"
+    return result
+
+
+def test_examples(directories=(), jobs=0, timeout=60, use_cache=True, stub=False,
+                  report=report_path):
+    """
+    Compile and run every example in config.example_dir, or only those in
+    the given package directories.
+    """
+    if not config.example_dir.exists():
+        return "Run 'extract' command first"
+    toolchain = toolchain_for(config.language_name, stub)
+    try:
+        version = toolchain.version()
+    except (OSError, subprocess.SubprocessError) as e:
+        return f"Cannot run {toolchain.compiler}: {e}"
+    all_sources = sorted(config.example_dir.rglob(f"*{toolchain.suffix}"))
+    sources = [source for source in all_sources
+               if not directories or source.parent.name in directories]
+    cache = ResultCache.load() if use_cache else ResultCache()
+    start = time.time()
+
+    def name(source):
+        return source.relative_to(config.example_dir).as_posix()
+
+    def key(source):
+        return digest(source.read_bytes(), toolchain.name, version, timeout)
+
+    results = {}
+    stale = []
+    for source in sources:
+        cached = cache.lookup(name(source), toolchain.name, key(source))
+        if cached:
+            results[source] = dict(cached, cached=True)
+        else:
+            stale.append(source)
+    with ThreadPoolExecutor(max_workers=jobs or os.cpu_count()) as pool:
+        futures = {source: pool.submit(test_example, source, toolchain, timeout)
+                   for source in stale}
+        for source in stale:
+            result = futures[source].result()
+            if not result["status"].endswith("timeout"):  # Might pass next time
+                cache.store(name(source), toolchain.name, key(source), result)
+            results[source] = dict(result, cached=False)
+            print(f"{result['status']}: {name(source)}")
+            if result["status"] != "passed":
+                print(result["errors"].rstrip())
+    cache.save({name(source) for source in all_sources})
+
+    passed = sum(result["status"] == "passed" for result in results.values())
+    summary = {
+        "toolchain": toolchain.name,
+        "version": version,
+        "examples": len(results),
+        "passed": passed,
+        "failed": len(results) - passed,
+        "cached": len(results) - len(stale),
+        "seconds": round(time.time() - start, 3),
+    }
+    report.write_text(json.dumps({
+        "summary": summary,
+        "results": [dict(results[source], example=name(source)) for source in sources],
+    }, indent=1))
+    return (f"{passed} of {len(results)} examples passed "
+            f"({summary['cached']} cached, {summary['seconds']}s); report in {report}")
@@ -1,16 +1,19 @@
 #! py -3
 # Extract code into config.example_dir from Markdown files.
 # import logging
+import json
 import os
-import re
 import string
-import subprocess
 import sys
-from collections import defaultdict
 from datetime import date
 
 import book_builder.config as config
+import book_builder.profiling as profiling
+import book_builder.markdown_tokens as tokens
 import book_builder.util as util
+from book_builder.corpus import Corpus
+from book_builder.duplicates import file_names
+from book_builder.validation_cache import digest
 
 # import colorama
 
@@ -35,67 +38,137 @@ def clean():
 
 def write_listing(file_path, listing):
     debug(f"writing {file_path}")
-    if not file_path.parent.exists():
-        file_path.parent.mkdir(parents=True)
+    file_path.parent.mkdir(parents=True, exist_ok=True)
     with file_path.open("w", newline='') as listing_file:
         debug(listing)
         listing_file.write(listing.strip() + "\n")
 
 
-def add_copyright_reference(file_extension="kt"):
+def with_copyright_reference(listing):
     """Insert reference to copyright notice after slugline"""
-    if not config.example_dir.exists():
-        return f"Cannot find {config.extracted_examples}"
-    for code_file in config.example_dir.rglob(f"*.{file_extension}"):
-        lines = code_file.read_text().strip().splitlines()
-        lines.insert(1, copyright_link)
-        code_file.write_text("\n".join(lines) + "\n")
+    lines = listing.strip().splitlines()
+    lines.insert(1, copyright_link)
+    return "\n".join(lines) + "\n"
+
+
+def example_files():
+    """
+    Every file extraction produces, as {path: contents}, built in memory.
+    Later listings with the same path replace earlier ones.
+    """
+    files = {}
+    listings = []
+    for atom in Corpus.of().atoms():
+        debug(f"--- {atom.name} ---")
+        for span in atom.listings:
+            code = span.code
+            listing = code.splitlines()
+            title = listing[0]
+            if '!!!' in title:
+                continue  # Don't save files that are marked bad
+            if tokens.slugline.match(title):
+                debug(title)
+                fpath = title.split()[1].strip()
+                atom_directory = fpath.split('/')[0]
+                if atom_directory in config.exclude_atoms:
+                    # Put it in the separate exclude tree:
+                    files[config.exclude_dir / fpath] = code
+                elif atom_directory == "Tests":
+                    files[config.extracted_examples / fpath] = code
+                else:
+                    files[config.example_dir / fpath] = code
+                    listings.append((fpath, code))
+            elif title.strip() == "// ... Continuing":
+                fpath, body = listings[-1]
+                assert body.splitlines()[-1] == "// Continued ...", f"!!! {body}\n\n>>>{title}"
+                combined = body.strip() + "\n" + code.strip()
+                listings[-1] = (fpath, combined)
+                files[config.example_dir / fpath] = combined
+    return {
+        path: with_copyright_reference(code)
+        if path.suffix in (".kt", ".java") and config.example_dir in path.parents
+        else code.strip() + "\n"
+        for path, code in files.items()
+    }
 
 
+class ExtractionManifest:
+    """
+    Records the files the last extraction produced, relative to
+    config.extracted_examples, so the next one can remove only its own
+    orphans and leave anything else in the examples tree alone.
+    """
+    path = config.data_path / "extracted_examples.json"
+
+    @staticmethod
+    def previous_files():
+        if ExtractionManifest.path.exists():
+            try:
+                names = json.loads(ExtractionManifest.path.read_text())
+                return {config.extracted_examples / name for name in names}
+            except ValueError:
+                print(f"Ignoring corrupt {ExtractionManifest.path.name}")
+        # No record, so treat everything in example_dir as extracted,
+        # since extraction used to erase it first:
+        if not config.example_dir.exists():
+            return set()
+        return {path for path in config.example_dir.rglob("*") if path.is_file()}
+
+    @staticmethod
+    def save(files):
+        manifest = {
+            path.relative_to(config.extracted_examples).as_posix(): digest(contents)
+            for path, contents in sorted(files.items())
+        }
+        temp = ExtractionManifest.path.with_suffix(".tmp")
+        temp.write_text(json.dumps(manifest, indent=1))
+        os.replace(str(temp), str(ExtractionManifest.path))
+
+
+def current_contents(path):
+    try:
+        with path.open(newline='') as existing:
+            return existing.read()
+    except (OSError, UnicodeDecodeError):
+        return None
+
+
+def remove_empty_directories(directory):
+    while directory != config.extracted_examples and directory.exists():
+        if any(directory.iterdir()):
+            return
+        directory.rmdir()
+        directory = directory.parent
+
+
+@profiling.profiled("target", "extract examples")
 def extractExamples():
+    """
+    Write only the example files whose contents changed and remove only the
+    files no longer produced, so unchanged examples keep their timestamps
+    and incremental Gradle builds stay incremental.
+    """
     print("Extracting examples ...")
     if not config.extracted_examples.exists():
         return f"Cannot find {config.extracted_examples}"
     if not config.markdown_dir.exists():
         return f"Cannot find {config.markdown_dir}"
-    if config.example_dir.exists():
-        print(clean())
-
-    slugline = re.compile("^(//|#) .+?\.[a-z]+$", re.MULTILINE)
-
-    listings = []
-
-    for sourceText in config.markdown_dir.glob("*.md"):
-        debug(f"--- {sourceText.name} ---")
-        with sourceText.open("rb") as chapter:
-            text = chapter.read().decode("utf-8", "ignore")
-            for group in re.findall("```(.*?)\n(.*?)\n```", text, re.DOTALL):
-                listing = group[1].splitlines()
-                title = listing[0]
-                if '!!!' in title:
-                    continue  # Don't save files that are marked bad
-                if slugline.match(title):
-                    debug(title)
-                    fpath = title.split()[1].strip()
-                    atom_directory = fpath.split('/')[0]
-                    if atom_directory in config.exclude_atoms:
-                        # Put it in the separate exclude tree:
-                        write_listing(config.exclude_dir / fpath, group[1])
-                    elif atom_directory == "Tests":
-                        # print(fpath)
-                        write_listing(config.example_dir / ".." / fpath, group[1])
-                    else:
-                        write_listing(config.example_dir / fpath, group[1])
-                        listings.append((fpath, group[1]))
-                elif title.strip() == "// ... Continuing":
-                    fpath, body = listings[-1]
-                    assert body.splitlines()[-1] == "// Continued ...", f"!!! {body}\n\n>>>{title}"
-                    combined = body.strip() + "\n" + group[1].strip()
-                    listings[-1] = (fpath, combined)
-                    write_listing(config.example_dir / fpath, combined)
-    add_copyright_reference(file_extension="kt")
-    add_copyright_reference(file_extension="java")
-    return f"Code extracted into {config.example_dir}"
+    files = example_files()
+    written = 0
+    for path, contents in sorted(files.items()):
+        if current_contents(path) != contents:
+            write_listing(path, contents)
+            written += 1
+    removed = 0
+    for orphan in sorted(ExtractionManifest.previous_files() - files.keys()):
+        if orphan.exists():
+            debug(f"removing {orphan}")
+            orphan.unlink()
+            remove_empty_directories(orphan.parent)
+            removed += 1
+    ExtractionManifest.save(files)
+    return (f"Code extracted into {config.example_dir}: {written} written, "
+            f"{len(files) - written} unchanged, {removed} removed")
 
 
 ########################### tasks.gradle generation ##########################
@@ -118,14 +191,12 @@ task run (dependsOn: [
 
 
 def report_duplicate_file_names(*patterns, check_for_duplicates):
-    fnames = []
-    for pattern in patterns:
-        fnames += [kt.name for kt in config.example_dir.rglob(pattern)]
-    # from pprint import pprint
-    # pprint(fnames)
-    duplicates = [x.strip() for x in fnames if fnames.count(x) >= 2 and not x.startswith("Task")]
+    names = file_names(config.example_dir, *patterns)
+    duplicates = {name: paths for name, paths in names.duplicates().items()
+                  if not name.startswith("Task")}
     if duplicates and check_for_duplicates:
-        dupstring = '\n\t'.join(duplicates)
+        dupstring = "".join(f"\t{name}: {', '.join(str(p) for p in paths)}\n"
+                            for name, paths in duplicates.items())
         print(f"ERROR: Duplicate code file names: \n{dupstring}")
         sys.exit(1)
 
@@ -161,9 +232,9 @@ task $task_name(type: JavaExec) {
 """)
 
 
-def task(codefile):
+def main_class(codefile, code):
+    "Fully-qualified name of the class holding codefile's main()"
     package = ""
-    code = codefile.read_text()
     packages = [line.split()[1].strip()
                 for line in code.splitlines()
                 if line.startswith("package ")]
@@ -177,8 +248,14 @@ def task(codefile):
         classfile = f"{codefile.stem}"
     if package:
         classfile = f"{package}.{classfile}"
+    return classfile
+
+
+def task(codefile):
+    code = codefile.read_text()
     if "main(" in code:
-        return task_template.substitute(task_name=codefile.stem, class_file=classfile)
+        return task_template.substitute(
+            task_name=codefile.stem, class_file=main_class(codefile, code))
     return None
 
 
@@ -249,7 +326,7 @@ def make_all_run_sh_executable():
     """
     for package in [d for d in config.example_dir.iterdir() if d.is_dir()]:
         os.chdir(package)
-        os.system("git update-index --chmod=+x run.sh")
+        profiling.system("git update-index --chmod=+x run.sh")
         # os.chmod(package / "run.sh", stat.S_IXOTH)
     return "run.sh files now executable via git"
 
@@ -259,47 +336,3 @@ def display_extracted_examples():
         print(package.relative_to(config.example_dir))
         for example in package.rglob(f"*.{config.code_ext}"):
             print(f"    {example.relative_to(package)}")
-
-
-class ExampleTest:
-    def __init__(self, path):
-        assert path.suffix == f".{config.code_ext}"
-        self.path = path
-        self.success = None
-
-    def test(self):
-        os.chdir(self.path.parent)
-        cmd = ["kotlinc", f"{self.path.name}"]
-        self.result = subprocess.run(
-            cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, shell=True)
-        self.stdout = self.result.stdout.decode('utf-8')
-        self.stderr = self.result.stderr.decode('utf-8')
-        self.success = len(self.stderr) == 0
-
-    def __str__(self):
-        result = ""
-        if self.success is not None:
-            result = "OK: " if self.success else "Failed: "
-        result += self.path.name
-        return result
-
-
-def compile_all_examples():
-    "Compile and capture all results, to show percentage of rewritten examples"
-    count = 0
-    examples = defaultdict(list)
-    for example in (config.example_dir / "abstractclasses").rglob(f"*.{config.code_ext}"):
-        examples[example.parts[-2]].append(ExampleTest(example))
-        count += 1
-    for edir in examples:
-        print(edir)
-        for exmpl in examples[edir]:
-            print(f"    {exmpl}")
-            exmpl.test()
-    print(f"example count = {count}")
-    for edir in examples:
-        print(f"=== {edir} ===")
-        for et in examples[edir]:
-            print(f"    {et}")
-            if not et.success:
-                print(f"    {et.stderr}")
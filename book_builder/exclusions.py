@@ -0,0 +1,125 @@
+"""
+Things the validators have been told not to report again: a sentence with a
+hot word, a slugline, a ticked word and so on. They're kept in one JSON file,
+{validator: {atom: [items]}}, where each item has its whitespace normalized
+so membership is a set lookup rather than a search of the file's text.
+
+Atoms are keyed without their number, so exclusions survive renumbering;
+'*' holds items that apply to every atom. New items are collected during a
+run and written in a single batch at the end of it. Sections are imported
+from the old exclusion text files the first time they're used.
+"""
+import json
+import re
+
+import book_builder.data_files as data_files
+from book_builder.line_scanner import normalized
+from book_builder.validation_cache import digest
+
+any_atom = "*"
+atom_header = re.compile(r"^(\S+\.md):$")
+
+
+def atom_key(atom_name):
+    """Atom file name without its number"""
+    return re.sub(r"^\d+_", "", atom_name)
+
+
+def legacy_items(text, msgbreak):
+    """
+    Items from an old exclusion text file, where each entry was an atom
+    name, the message and a msgbreak line. Anything in the file used to
+    be excluded in every atom, so that's where the items go.
+    """
+    items = set()
+    for line in text.splitlines():
+        line = line.strip()
+        if line == msgbreak or atom_header.match(line):
+            continue
+        if normalized(line):
+            items.add(normalized(line))
+    return items
+
+
+class ExclusionStore:
+    def __init__(self, path, msgbreak):
+        self.path = path
+        self.msgbreak = msgbreak
+        self.sections = None  # Loaded on first use
+        self.items = {}  # Section: set of (atom key, item), for lookups
+        self.digests = {}
+        self.added = []  # (section, atom key, item) to write at the end of the run
+        self.migrated = {}  # Legacy path: (section, atoms)
+
+    def _read(self):
+        if self.path.exists():
+            try:
+                return json.loads(self.path.read_text(encoding="utf-8"))
+            except ValueError:
+                print(f"Ignoring corrupt {self.path.name}")
+        return {}
+
+    def section(self, name, legacy_path=None):
+        """Set of (atom key, item) for the section, migrating legacy_path if necessary"""
+        if name not in self.items:
+            if self.sections is None:
+                self.sections = self._read()
+            if name not in self.sections and legacy_path and legacy_path.exists():
+                self.sections[name] = {any_atom: sorted(legacy_items(
+                    legacy_path.read_text(encoding="utf-8"), self.msgbreak))}
+                self.migrated[legacy_path] = (name, self.sections[name])
+            atoms = self.sections.get(name, {})
+            self.items[name] = {(atom, item) for atom, items in atoms.items() for item in items}
+            self.digests[name] = digest(json.dumps(atoms, sort_keys=True))
+        return self.items[name]
+
+    def digest(self, name, legacy_path=None):
+        """Of the section as loaded; items added during a run don't change it"""
+        self.section(name, legacy_path)
+        return self.digests[name]
+
+    def contains(self, name, atom_name, item, legacy_path=None):
+        items = self.section(name, legacy_path)
+        item = normalized(str(item))
+        return (atom_key(atom_name), item) in items or (any_atom, item) in items
+
+    def add(self, name, atom_name, item):
+        """Exclude item from now on, as contains() will look it up"""
+        atom = atom_key(atom_name) if atom_name != any_atom else any_atom
+        if normalized(str(item)):
+            self.added.append((name, atom, normalized(str(item))))
+
+    def save(self):
+        """
+        Write everything added, and any migrated sections, as one batch.
+        The file is read again first, so edits made during the run (or by
+        another bb process) are kept.
+        """
+        if not self.added and not self.migrated:
+            return
+        with data_files.locked(self.path):
+            new = self._merge()
+        if new:
+            print(f"{new} exclusion(s) added to {self.path.name}; "
+                  f"remove any that are real problems")
+        for legacy_path in self.migrated:
+            print(f"Imported {legacy_path.name} into {self.path.name}; it can be deleted")
+        self.added = []
+        self.migrated = {}
+
+    def _merge(self):
+        """Add to the file's current contents; returns the number of new items"""
+        sections = self._read()
+        for name, atoms in self.migrated.values():
+            sections.setdefault(name, atoms)
+        merged = {(name, atom): set(items)
+                  for name, atoms in sections.items() for atom, items in atoms.items()}
+        before = sum(len(items) for items in merged.values())
+        for name, atom, item in self.added:
+            merged.setdefault((name, atom), set()).add(item)
+        sections = {}
+        for (name, atom), items in merged.items():
+            sections.setdefault(name, {})[atom] = sorted(items)
+        data_files.replace(
+            self.path, json.dumps(sections, indent=2, sort_keys=True, ensure_ascii=False))
+        return sum(len(items) for items in merged.values()) - before
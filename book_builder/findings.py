@@ -0,0 +1,131 @@
+"""
+Validation results as data rather than printed text, for dashboards and for
+diffing one run against another. Each Finding is written as it's produced,
+so a large run isn't held in memory:
+
+    bb validate --jsonl findings.jsonl --sarif findings.sarif --junit findings.xml all
+
+Lines and columns are one-based, or None where a validator doesn't know them.
+'excluded' findings were found but suppressed by the validator's exclusions.
+"""
+import contextlib
+import json
+from collections import namedtuple
+from xml.sax.saxutils import escape, quoteattr
+
+
+class Finding(namedtuple("Finding", "validator atom line column severity message excluded")):
+    __slots__ = ()
+
+
+class JsonLinesWriter:
+    """One JSON object per finding, per line"""
+
+    def __init__(self, path, rules, markdown_dir):
+        self.stream = open(str(path), "w", encoding="utf-8")
+
+    def check(self, validator, atom, findings):
+        for finding in findings:
+            self.stream.write(json.dumps(finding._asdict(), ensure_ascii=False) + "\n")
+
+    def close(self):
+        self.stream.close()
+
+
+class SarifWriter:
+    """SARIF 2.1.0, with a rule for each validator"""
+    levels = {"error": "error", "warning": "warning"}
+
+    def __init__(self, path, rules, markdown_dir):
+        self.stream = open(str(path), "w", encoding="utf-8")
+        self.first = True
+        header = json.dumps({
+            "$schema": "https://json.schemastore.org/sarif-2.1.0.json",
+            "version": "2.1.0",
+            "runs": [{
+                "tool": {"driver": {
+                    "name": "bb validate",
+                    "rules": [{"id": name, "shortDescription": {"text": description}}
+                              for name, description in rules.items()],
+                }},
+                "originalUriBaseIds": {"MARKDOWN": {"uri": markdown_dir.resolve().as_uri() + "/"}},
+                "results": [],
+            }],
+        }, indent=2, ensure_ascii=False)
+        # Results are streamed into the empty list:
+        self.head, self.tail = header.rsplit("[]", 1)
+        self.stream.write(self.head + "[")
+
+    def check(self, validator, atom, findings):
+        for finding in findings:
+            region = {}
+            if finding.line is not None:
+                region["startLine"] = finding.line
+            if finding.column is not None:
+                region["startColumn"] = finding.column
+            location = {"artifactLocation": {"uri": finding.atom, "uriBaseId": "MARKDOWN"}}
+            if region:
+                location["region"] = region
+            result = {
+                "ruleId": finding.validator,
+                "level": SarifWriter.levels.get(finding.severity, "note"),
+                "message": {"text": finding.message},
+                "locations": [{"physicalLocation": location}],
+            }
+            if finding.excluded:
+                result["suppressions"] = [{"kind": "external"}]
+            self.stream.write(("\n" if self.first else ",\n")
+                              + json.dumps(result, ensure_ascii=False))
+            self.first = False
+
+    def close(self):
+        self.stream.write("\n]" + self.tail + "\n")
+        self.stream.close()
+
+
+class JUnitWriter:
+    """A testcase for each validator run on each atom, failing if it found anything"""
+
+    def __init__(self, path, rules, markdown_dir):
+        self.stream = open(str(path), "w", encoding="utf-8")
+        self.stream.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                          '<testsuites name="bb validate">\n<testsuite name="validate">\n')
+
+    def check(self, validator, atom, findings):
+        self.stream.write(f"  <testcase classname={quoteattr(validator)} name={quoteattr(atom)}>\n")
+        failures = [f for f in findings if not f.excluded]
+        if failures:
+            details = "\n".join(
+                f"{f.atom}{'' if f.line is None else f':{f.line}'}: {f.severity}: {f.message}"
+                for f in failures)
+            self.stream.write(
+                f"    <failure message={quoteattr((failures[0].message.splitlines() or [''])[0])} "
+                f"type={quoteattr(failures[0].severity)}>{escape(details)}</failure>\n")
+        excluded = [f for f in findings if f.excluded]
+        if excluded:
+            details = "\n".join(f"Excluded: {f.message}" for f in excluded)
+            self.stream.write(f"    <system-out>{escape(details)}</system-out>\n")
+        self.stream.write("  </testcase>\n")
+
+    def close(self):
+        self.stream.write("</testsuite>\n</testsuites>\n")
+        self.stream.close()
+
+
+formats = {"jsonl": JsonLinesWriter, "sarif": SarifWriter, "junit": JUnitWriter}
+
+
+@contextlib.contextmanager
+def writers(reports, rules, markdown_dir):
+    """
+    Opens a writer for each {format: path} in reports. rules is
+    {validator name: description}.
+    """
+    opened = []
+    try:
+        for report_format, path in sorted(reports.items()):
+            opened.append(formats[report_format](path, rules, markdown_dir))
+        yield opened
+    finally:
+        for writer in opened:
+            writer.close()
@@ -3,52 +3,124 @@ Generate HTML ebook
 """
 import os
 import re
-from distutils.dir_util import copy_tree
-from pathlib import Path
+import shutil
+import subprocess
+import sys
+from concurrent.futures import ProcessPoolExecutor
 from collections import deque, OrderedDict
+from itertools import repeat
 import book_builder.config as config
+import book_builder.profiling as profiling
 from book_builder.config import BookType
 from book_builder.util import (copy_markdown_files,
                                header_to_filename_map,
                                regenerate_ebook_build_dir,
                                strip_review_notes)
+from book_builder.crosslinks import CrossLinkIndex
+from book_builder.validation_cache import digest
+
+
+html_cache_dir = config.data_path / "html_cache"
 
 
 def pandoc_html_command(input_file, ebook_type: BookType, highlighting=None):
-    "highlighting=None uses default (pygments) for source code color syntax highlighting"
+    """
+    highlighting=None uses default (pygments) for source code color syntax highlighting.
+    The command writes the HTML to stdout.
+    """
     assert input_file.exists(), f"Error: missing {input_file.name}"
     css_file = f"{config.base_name}-{ebook_type.value}.css".lower()
-    command = (
-        f"pandoc {input_file.name}"
-        f" -t html -o {input_file.stem}.html"
-        " --standalone"
-        " --template=pandoc-template.html"
-        " -f markdown-native_divs"
-        " -f markdown+smart"
-        " --toc-depth=2"
-        f' --metadata title="{config.title}: {(input_file.stem)[4:]}"'
-        f" --css={css_file}")
+    command = [
+        "pandoc", input_file.name,
+        "-t", "html",
+        "--standalone",
+        "--template=pandoc-template.html",
+        "-f", "markdown-native_divs",
+        "-f", "markdown+smart",
+        "--toc-depth=2",
+        "--metadata", f"title={config.title}: {(input_file.stem)[4:]}",
+        f"--css={css_file}"]
     if highlighting:
-        command += f" --highlight-style={highlighting} "
-    print(f"{input_file.stem}.html")
-    os.system(command)
+        command.append(f"--highlight-style={highlighting}")
+    return command
+
+
+def pandoc_version():
+    result = profiling.run(["pandoc", "--version"], stdout=subprocess.PIPE,
+                           universal_newlines=True)
+    return result.stdout.splitlines()[0] if result.stdout else ""
+
+
+def patch_tags(text):
+    # According to Leonardo's directions
+    text = re.sub("<pre.*?>(.*?)</pre>", "\g<1>", text, flags=re.DOTALL)
+    return text.replace("a.sourceLine { display: inline-block; line-height: 1.25; }",
+                        "a.sourceLine { display: inline; line-height: 1.25; }")
+
+
+def render_page(md, command, cached):
+    """
+    Run in a worker process: pandoc md to HTML, patch the tags and write the
+    page, keeping a copy in the cache. Returns an error message or None.
+    """
+    result = profiling.run(command, cwd=str(md.parent),
+                           stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if result.returncode != 0:
+        return f"{md.name}: pandoc failed\n{result.stderr.decode('utf-8', 'replace')}"
+    html = md.with_suffix(".html")
+    html.write_text(patch_tags(result.stdout.decode('utf-8')), encoding='utf-8')
+    shutil.copyfile(str(html), str(cached))
+    return None
+
+
+def render_pages(target_dir, workers=0):
+    """
+    Convert each Markdown file in target_dir to HTML, in parallel. Pages are
+    cached by everything they depend on, so unchanged pages are copied from
+    the cache instead of being rendered again.
+    """
+    cache = html_cache_dir / target_dir.name
+    cache.mkdir(parents=True, exist_ok=True)
+    shared = [pandoc_version(), config.html_pandoc_template.read_text(encoding='utf-8'),
+              config.html_css.read_text(encoding='utf-8')]
+    used = set()
+    pending = []
+    for md in sorted(target_dir.glob("*.md")):
+        command = pandoc_html_command(md, BookType.HTML)
+        cached = cache / f"{digest(md.read_text(encoding='utf-8'), *shared, *command)}.html"
+        used.add(cached)
+        print(f"{md.stem}.html")
+        if cached.exists():
+            shutil.copyfile(str(cached), str(md.with_suffix(".html")))
+        else:
+            pending.append((md, command, cached))
+    errors = []
+    if pending:
+        with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+            errors = [e for e in profiling.collected(pool.map(
+                profiling.worker_call, repeat(profiling.enabled), repeat(render_page),
+                *zip(*pending))) if e]
+    for stale in set(cache.glob("*.html")) - used:
+        stale.unlink()
+    if errors:
+        sys.exit("\n".join(errors))
+    print(f"{len(pending)} pages rendered, {len(used) - len(pending)} unchanged")
 
 
 def html_fix_crosslinks(target_dir):
-    hfm = header_to_filename_map(target_dir)
-    titles = list(hfm.keys())
-    cross_link = re.compile(r"\[.*?\]", flags=re.DOTALL)
+    index = CrossLinkIndex.of(target_dir)
+
+    def link(text, target):
+        return f'<a target="_blank" href="{target.href("html")}">{text}</a>'
+
+    def explicit(text, anchor, target):
+        return link(text, target) if target else f"[{text}](#{anchor})"
+
     for md in target_dir.glob("*.md"):
         if "000_Front" in md.name:
             continue
-        text = md.read_text()
-        for lnk in cross_link.findall(text):
-            link = lnk.replace("\n", " ")
-            if link[1:-1] in titles:  # Trim first and last to remove []
-                trans = hfm[link[1:-1]]
-                new_link = f'<a target="_blank" href="{trans[1]}.html">{link[1:-1]}</a>'
-                text = text.replace(lnk, new_link)
-        md.write_text(text)
+        text = index.sub_explicit(md.read_text(), explicit)
+        md.write_text(index.sub_bare(text, link))
 
 
 def html_sample_end_fixup(target_dir, end_text=""):
@@ -109,19 +181,11 @@ class Footer:
             self.copyright
 
 
-def convert_to_html(target_dir, sample: bool = True):
+@profiling.profiled("target", "html")
+def convert_to_html(target_dir, sample: bool = True, workers=0):
     """
     Pandoc markdown to html demo book for website
     """
-    def patch_tags(md: Path):
-        # According to Leonardo's directions
-        text = re.sub("<pre.*?>(.*?)</pre>", "\g<1>",
-                      md.read_text(encoding='utf-8'),
-                      flags=re.DOTALL)
-        text = text.replace("a.sourceLine { display: inline-block; line-height: 1.25; }",
-                            "a.sourceLine { display: inline; line-height: 1.25; }")
-        md.write_text(text, encoding='utf-8')
-
     regenerate_ebook_build_dir(target_dir, BookType.HTML)
     copy_markdown_files(target_dir, strip_notes=False)
     html_fix_crosslinks(target_dir)
@@ -131,18 +195,17 @@ def convert_to_html(target_dir, sample: bool = True):
     Footer.init(target_dir)
     for md in Footer.markdowns:
         md.write_text(md.read_text() + str(Footer(md)))
-    os.chdir(str(target_dir))
-    for md in sorted(list(Path().glob("*.md"))):
+    for md in sorted(target_dir.glob("*.md")):
         strip_review_notes(md)
-        pandoc_html_command(md, BookType.HTML)
+    render_pages(target_dir, workers)
     for md in target_dir.rglob("*.md"):
         md.unlink()
-    for html in target_dir.rglob("*.html"):
-        patch_tags(html)
     pandoc_template = target_dir / "pandoc-template.html"
     if pandoc_template.exists():
         pandoc_template.unlink()
     if sample:
         # Inject results into hugo site:
-        copy_tree(str(target_dir), str(config.web_html_book))
+        from distutils.dir_util import copy_tree  # Slow to import
+        with profiling.timed("copy", "html to website"):
+            copy_tree(str(target_dir), str(config.web_html_book))
     return f"\n[{target_dir.name} Completed]"
@@ -0,0 +1,119 @@
+"""
+Runs external tools (pandoc, kindlegen, zip) as a graph of jobs. Each job
+starts as soon as the jobs it depends on have succeeded, with independent
+jobs running in parallel. Every job's exit status and output are captured;
+the first failure stops the build, and a summary shows what happened.
+"""
+import os
+import shlex
+import subprocess
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import book_builder.profiling as profiling
+
+
+class Job:
+    """
+    A command to run in cwd after the jobs named in 'after'. 'ok' holds the
+    exit codes that count as success. If 'log' is given, the job's output
+    is also written there.
+    """
+
+    def __init__(self, name, command, cwd=None, after=(), ok=(0,), log=None):
+        self.name = name
+        self.command = command
+        self.cwd = cwd
+        self.after = list(after)
+        self.ok = ok
+        self.log = log
+        self.status = "pending"
+        self.returncode = None
+        self.output = ""
+        self.seconds = 0.0
+        self.process = None
+        self.cancelled = False
+
+    def run(self):
+        start = time.time()
+        if self.cancelled:  # Before it started
+            self.status = "cancelled"
+            return self
+        try:
+            with profiling.external(self.command, self.cwd):
+                self.process = subprocess.Popen(
+                    self.command, cwd=str(self.cwd) if self.cwd else None,
+                    stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+                out, _ = self.process.communicate()
+            self.returncode = self.process.returncode
+            self.output = out.decode("utf-8", "replace")
+        except OSError as e:
+            self.output = f"Cannot run {self.command[0]}: {e}"
+        self.seconds = time.time() - start
+        if self.log:
+            self.log.write_text(self.output)
+        if self.cancelled:
+            self.status = "cancelled"
+        else:
+            self.status = "ok" if self.returncode in self.ok else "failed"
+        return self
+
+    def cancel(self):
+        self.cancelled = True
+        if self.process and self.process.poll() is None:
+            self.process.terminate()
+
+    def __str__(self):
+        return f"{self.name:<40} {self.status:<10} {self.seconds:6.1f}s"
+
+
+def run_jobs(jobs, workers=0):
+    """
+    Runs jobs with at most 'workers' at once (0 uses all cores). On the
+    first failure, cancels the running jobs, skips the rest and exits with
+    the failed job's output.
+    """
+    by_name = {job.name: job for job in jobs}
+    for job in jobs:
+        for name in job.after:
+            if name not in by_name:
+                raise ValueError(f"Job {job.name} depends on unknown job {name}")
+    limit = workers or os.cpu_count()
+    pending = list(jobs)
+    running = {}
+    failed = None
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=limit) as pool:
+        while pending or running:
+            if failed is None:
+                for job in list(pending):
+                    if len(running) >= limit:
+                        break
+                    if all(by_name[name].status == "ok" for name in job.after):
+                        pending.remove(job)
+                        job.status = "running"
+                        print(f"\t{job.name} ...")
+                        running[pool.submit(job.run)] = job
+            if not running:
+                break  # Nothing can start: a failure, or a dependency cycle
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                job = running.pop(future)
+                future.result()
+                if job.status == "failed" and failed is None:
+                    failed = job
+                    for other in running.values():
+                        other.cancel()
+    for job in pending:
+        job.status = "skipped"
+    print(f"{'job':<40} {'status':<10} {'time':>7}")
+    for job in jobs:
+        print(job)
+    print(f"{len(jobs)} jobs in {time.time() - start:.1f}s")
+    if failed:
+        sys.exit(f"\n{failed.name} failed (exit status {failed.returncode}):\n"
+                 f"{' '.join(shlex.quote(str(part)) for part in failed.command)}\n{failed.output}")
+    if pending:
+        sys.exit(f"Jobs with unresolvable dependencies: {', '.join(j.name for j in pending)}")
+    return jobs
@@ -1,9 +1,11 @@
-import os
 import re
 import shutil
-from distutils.dir_util import copy_tree
 
 import book_builder.config as config
+import book_builder.profiling as profiling
+import book_builder.markdown_tokens as tokens
+from book_builder.corpus import Corpus
+from book_builder.crosslinks import CrossLinkIndex
 from book_builder.util import pushd
 
 exercise_message = "***Exercises and solutions for this atom can be found at AtomicKotlin.com/exercises.***"
@@ -13,6 +15,7 @@ manuscript_dir = leanpub_repo / "manuscript"
 manuscript_images = manuscript_dir / "images"
 
 
+@profiling.profiled("target", "leanpub")
 def generate_leanpub_manuscript(with_sample=True):
     """
     Create a new version of the Leanpub book
@@ -22,13 +25,14 @@ def generate_leanpub_manuscript(with_sample=True):
     if not success:
         return False, fail_msg
     (manuscript_dir / "Book.txt").write_text(
-        "\n".join([md.name for md in config.markdown_dir.glob("*.md")]).strip())
+        "\n".join([atom.name for atom in Corpus.of().atoms()]).strip())
     if with_sample:
         create_sample_txt()
     strip_double_curly_tags()
     return True, "Succeeded"
 
 
+@profiling.profiled("target", "leanpub print-ready")
 def generate_print_ready_manuscript():
     """
     So everything is monochrome in resulting PDF
@@ -41,25 +45,20 @@ def generate_print_ready_manuscript():
     code_completion_mono = manuscript_images / "objectsEverywhere" / "codeCompletion-Grayscale.png"
     code_completion_color.unlink()
     code_completion_mono.replace(code_completion_color)
-    # Convert code listings to monochrome:
+    # Convert code listings to monochrome, and cross-links to italicized bold:
+    index = CrossLinkIndex.of(manuscript_dir)
+
+    def convert_cross_link(text, anchor, target):
+        if not target:
+            print(f"Unresolved cross-link: [{text}](#{anchor})")
+        name = text.replace("*", "").replace("[", "***").replace("]", "***")
+        return f"***{name}***"
+
     for md in manuscript_dir.glob("*.md"):
         text = md.read_text()
         text = text.replace("```kotlin", "```text")
         text = text.replace("```java", "```text")
-        md.write_text(text)
-
-    # Convert cross-links to italicized bold:
-    def convert_cross_link(matchobj):
-        original = matchobj.group(0)
-        name = original.split("(#")[0]
-        name = name.replace("*", "")
-        name = name.replace("[", "***")
-        name = name.replace("]", "***")
-        return name
-
-    cross_links = re.compile(r"\[[^]]+?\]\(\#.+?\)", re.DOTALL)
-    for md in manuscript_dir.glob("*.md"):
-        md.write_text(cross_links.sub(convert_cross_link, md.read_text()))
+        md.write_text(index.sub_explicit(text, convert_cross_link))
 
 
 def recreate_leanpub_manuscript():
@@ -69,7 +68,9 @@ def recreate_leanpub_manuscript():
         return False, f"Cannot find {leanpub_repo}"
     if manuscript_dir.exists():
         shutil.rmtree(manuscript_dir, ignore_errors=True)
-    copy_tree(str(config.markdown_dir), str(manuscript_dir))
+    from distutils.dir_util import copy_tree  # Slow to import
+    with profiling.timed("copy", "markdown to manuscript"):
+        copy_tree(str(config.markdown_dir), str(manuscript_dir))
     for md in manuscript_dir.glob("*.md"):
         # text = re.sub(r"!\[(.*?)\]\(images/.+?/(.+?)\)", r"![\1](images/\2)", md.read_text())
         text = md.read_text()
@@ -145,20 +146,19 @@ def git_commit_leanpub(msg):
     Commit current leanpub version to github repo
     """
     with pushd(leanpub_repo):
-        os.system(f"""git commit -a -m "{msg}" """)
-        os.system("git push")
+        profiling.system(f"""git commit -a -m "{msg}" """)
+        profiling.system("git push")
 
 
 def check_for_sample_end():
     """
     Look for missing {{SAMPLE_END}} in md files
     """
-    for md in config.markdown_dir.glob("*.md"):
-        text = md.read_text()
-        if "_Section_" in md.name or "Appendices.md" in md.name:
-            print(f"{md.name}")
+    for atom in Corpus.of().atoms():
+        if "_Section_" in atom.name or "Appendices.md" in atom.name:
+            print(f"{atom.name}")
             continue
-        if "AtomicTest.md" in md.name: continue
-        if int(md.name[0:3]) < 32: continue
-        if "{{SAMPLE_END}}" not in text:
-            print(f"-> {md.name}\tNO {{SAMPLE_END}}")
+        if "AtomicTest.md" in atom.name: continue
+        if int(atom.name[0:3]) < 32: continue
+        if not atom.spans_of(tokens.SAMPLE_END):
+            print(f"-> {atom.name}\tNO {{SAMPLE_END}}")
@@ -0,0 +1,87 @@
+"""
+Finds many literal strings (hot words, bad characters, tabs) in a single
+pass over an atom. The strings are merged into a trie, which is compiled to
+one regular expression to locate every position where any of them begins;
+walking the trie from there reports each string, overlapping or not.
+"""
+import re
+from collections import namedtuple
+
+end = ""  # Trie key marking the end of a string
+
+
+def lines_of(text):
+    """
+    text split at each "\n", the only line break that scan() and line_of()
+    count. str.splitlines() also breaks at \r, \x0c, \x85, \u2028 and
+    others, which would put the line numbers out of step.
+    """
+    lines = text.split("\n")
+    if lines[-1] == "":  # A final newline doesn't start another line
+        lines.pop()
+    return lines
+
+
+class Match(namedtuple("Match", "kind text line column")):
+    """An occurrence of text, with zero-based line and column"""
+    __slots__ = ()
+
+
+def normalized(sentence):
+    """Whitespace collapsed, for comparing sentences"""
+    return " ".join(sentence.split())
+
+
+def trie_pattern(node):
+    """Regular expression matching the strings in the trie at node"""
+    alternatives = [re.escape(char) + trie_pattern(child)
+                    for char, child in sorted(node.items()) if char != end]
+    if not alternatives:
+        return ""
+    if len(alternatives) == 1 and end not in node:
+        return alternatives[0]
+    return "(?:" + "|".join(alternatives) + ")" + ("?" if end in node else "")
+
+
+class LineScanner:
+    def __init__(self, patterns):
+        """patterns is {kind: strings to find}; empty strings are ignored"""
+        self.trie = {}
+        for kind, strings in patterns.items():
+            for string in strings:
+                if string:
+                    node = self.trie
+                    for char in string:
+                        node = node.setdefault(char, {})
+                    node.setdefault(end, set()).add(kind)
+        self.starts = re.compile(f"(?={trie_pattern(self.trie)})") if self.trie else None
+
+    def strings_at(self, text, offset):
+        """(string, kinds) for each string beginning at offset, shortest first"""
+        node = self.trie
+        for stop in range(offset, len(text)):
+            node = node.get(text[stop])
+            if node is None:
+                return
+            if end in node:
+                yield text[offset:stop + 1], node[end]
+
+    def scan(self, text):
+        """List of Matches in text, in order"""
+        if self.starts is None:
+            return []
+        matches = []
+        line = 0
+        line_start = 0
+        previous = 0
+        for found in self.starts.finditer(text):
+            offset = found.start()
+            newlines = text.count("\n", previous, offset)
+            if newlines:
+                line += newlines
+                line_start = text.rfind("\n", previous, offset) + 1
+            previous = offset
+            for string, kinds in self.strings_at(text, offset):
+                for kind in sorted(kinds):
+                    matches.append(Match(kind, string, line, offset - line_start))
+        return matches
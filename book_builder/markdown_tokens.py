@@ -0,0 +1,137 @@
+"""
+Single-pass tokenizer for Markdown atoms. Splits an atom into typed spans
+(listings, prose, headers, the exercise block, {{ notes }} and sample-end
+markers) in one linear scan, so tools don't each rescan the same text with
+their own regular expressions. Results are memoized, so each atom is
+tokenized once per process (the limit keeps a long-running 'bb serve' from
+holding every version of every edited atom).
+"""
+import re
+from collections import namedtuple
+from functools import lru_cache
+
+import book_builder.config as config
+
+LISTING = "listing"
+PROSE = "prose"
+HEADER = "header"
+EXERCISES = "exercises"
+NOTE = "note"
+SAMPLE_END = "sample_end"
+
+sample_end_tag = "{{SAMPLE_END}}"
+header_line = re.compile(r"-?#+ ")
+note = re.compile("{{.*?}}", flags=re.DOTALL)
+# An example's first line, naming the file it's extracted to, such as
+# "// hello/HelloWorld.kt" ("#" starts it in shell and Python examples):
+slugline = re.compile(r"^(?P<comment>//|#) (?P<path>.+?\.[a-z]+)$", flags=re.MULTILINE)
+
+
+class Span(namedtuple("Span", "kind start end line text")):
+    """
+    A typed piece of an atom. 'start' and 'end' are character offsets
+    into the atom text, 'line' is the (zero-based) line the span starts on.
+    A listing's text runs from its opening ``` through its closing ```.
+    """
+    __slots__ = ()
+
+    @property
+    def marker(self):
+        """Opening line of a listing, such as ```kotlin"""
+        return self.text.split("\n", 1)[0]
+
+    @property
+    def code(self):
+        """Contents of a listing, between the opening and closing lines"""
+        return self.text[len(self.marker) + 1:-4]
+
+
+def slug_path(line, comments=("//", "#")):
+    """
+    The file that line names if it's a slugline starting with one of
+    comments, such as "hello/HelloWorld.kt"; otherwise None
+    """
+    match = slugline.match(line)
+    return match.group("path") if match and match.group("comment") in comments else None
+
+
+def _notes(text, start, line):
+    """{{ Notes }} and sample-end markers within a prose run"""
+    previous = 0
+    for match in note.finditer(text):
+        line += text.count("\n", previous, match.start())
+        previous = match.start()
+        kind = SAMPLE_END if match.group(0) == sample_end_tag else NOTE
+        yield Span(kind, start + match.start(), start + match.end(), line, match.group(0))
+
+
+@lru_cache(maxsize=1024)
+def tokenize(text):
+    """
+    Returns a tuple of Spans in order of their starting offsets. Listings,
+    prose and headers partition the text; the exercise block, notes and
+    sample-end markers overlap the prose and headers they appear in.
+    """
+    spans = []
+    prose_start = prose_line = None
+
+    def end_prose(end):
+        nonlocal prose_start
+        if prose_start is not None and end > prose_start:
+            prose = text[prose_start:end]
+            spans.append(Span(PROSE, prose_start, end, prose_line, prose))
+            spans.extend(_notes(prose, prose_start, prose_line))
+        prose_start = None
+
+    n = offset = 0
+    listing_start = listing_line = None
+    while offset < len(text):
+        newline = text.find("\n", offset)
+        line_end = len(text) if newline == -1 else newline
+        line = text[offset:line_end]
+        if listing_start is not None:
+            if line.startswith("```"):
+                end = offset + 3
+                spans.append(Span(LISTING, listing_start, end, listing_line,
+                                  text[listing_start:end]))
+                listing_start = None
+                prose_start, prose_line = end, n  # Remainder of the closing line
+        elif line.startswith("```") and newline != -1:
+            end_prose(offset)
+            listing_start, listing_line = offset, n
+        elif header_line.match(line):
+            end_prose(offset)
+            spans.append(Span(HEADER, offset, line_end, n, line))
+            spans.extend(_notes(line, offset, n))
+            prose_start, prose_line = line_end, n
+        else:
+            if line == config.exercise_header:
+                spans.append(Span(EXERCISES, offset, len(text), n, text[offset:]))
+            if prose_start is None:
+                prose_start, prose_line = offset, n
+        offset = line_end + 1
+        n += 1
+    if listing_start is not None:  # Unterminated, so treat it as prose
+        prose_start, prose_line = listing_start, listing_line
+    end_prose(len(text))
+    spans.sort(key=lambda span: span.start)
+    return tuple(spans)
+
+
+def spans_of(kind, text):
+    return [span for span in tokenize(text) if span.kind == kind]
+
+
+def listings(text):
+    return spans_of(LISTING, text)
+
+
+def without_listings(text):
+    """The atom text with each listing removed"""
+    pieces = []
+    previous = 0
+    for listing in listings(text):
+        pieces.append(text[previous:listing.start])
+        previous = listing.end
+    pieces.append(text[previous:])
+    return "".join(pieces)
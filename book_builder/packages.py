@@ -1,32 +1,29 @@
 #! py -3
 # Discover examples that don't have packages
 import logging
-import re
 from logging import debug
 
 import book_builder.config as config
+import book_builder.markdown_tokens as tokens
 # from book_builder.package_names import atom_package_names
 
 logging.basicConfig(filename=__file__.split(
     '.')[0] + ".log", filemode='w', level=logging.DEBUG)
 
-slugline = re.compile("^(//|#) .+?\.[a-z]+$", re.MULTILINE)
-
-
 def unpackaged(source_dir=config.markdown_dir):
     print("Discovering examples that don't have packages ...")
     if not source_dir.exists():
         return f"Cannot find {source_dir}"
     for sourceText in source_dir.glob("[0-9][0-9]_*.md"):
         debug(f"--- {sourceText.name} ---")
-        for group in re.findall("```(.*?)\n(.*?)\n```", sourceText.read_text(), re.DOTALL):
-            listing = group[1].splitlines()
+        for span in tokens.listings(sourceText.read_text()):
+            listing = span.code.splitlines()
             title = listing[0]
             package = None
             for line in listing:
                 if line.startswith("package "):
                     package = line.split()[1].strip()
-            if slugline.match(title):
+            if tokens.slugline.match(title):
                 debug(title)
                 fpath = title.split()[1].strip()
                 if package:
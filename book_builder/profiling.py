@@ -0,0 +1,165 @@
+"""
+Timing for 'bb --profile'. Validators, external tools, file copies and
+output targets are wrapped in timed(), which records their wall and CPU
+time while profiling is on and costs nothing otherwise. At the end of the
+command a summary table is printed, and the records can also be written
+as a Chrome trace (open it in chrome://tracing or ui.perfetto.dev).
+"""
+import json
+import os
+import shlex
+import subprocess
+import threading
+import time
+from collections import defaultdict, namedtuple
+from contextlib import contextmanager
+from functools import wraps
+
+enabled = False
+records = []  # A Record for each timed event, in the order they finished
+profiler = None  # cProfile.Profile, if requested
+
+
+class Record(namedtuple("Record", "category name start wall cpu pid tid args")):
+    """
+    'start' is time.time(), so records from worker processes line up.
+    'cpu' is the CPU time of this process, so it doesn't include the CPU
+    used by external tools.
+    """
+    __slots__ = ()
+
+
+@contextmanager
+def timed(category, name, **args):
+    if not enabled:
+        yield
+        return
+    start = time.time()
+    cpu = time.process_time()
+    try:
+        yield
+    finally:
+        records.append(Record(category, name, start, time.time() - start,
+                              time.process_time() - cpu, os.getpid(),
+                              threading.get_ident(), args))
+
+
+def profiled(category, name=None):
+    """Decorator that times each call of a function"""
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            with timed(category, name or function.__name__):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def command_line(command):
+    if isinstance(command, str):
+        return command
+    return " ".join(shlex.quote(str(part)) for part in command)
+
+
+def tool_name(command):
+    return os.path.basename(str(command.split()[0] if isinstance(command, str) else command[0]))
+
+
+@contextmanager
+def external(command, cwd=None):
+    """Times an external tool, recording its command line"""
+    with timed("subprocess", tool_name(command), command=command_line(command),
+               cwd=str(cwd or os.getcwd())):
+        yield
+
+
+def run(command, **kwargs):
+    """subprocess.run(), timed"""
+    with external(command, kwargs.get("cwd")):
+        return subprocess.run(command, **kwargs)
+
+
+def system(command):
+    """os.system(), timed"""
+    with external(command):
+        return os.system(command)
+
+
+def worker_call(profile, function, *args):
+    """
+    Call function in a pool worker, returning (result, records) so the
+    parent can add the worker's records to its own
+    """
+    global enabled
+    enabled = profile
+    first = len(records)
+    result = function(*args)
+    made = records[first:]
+    del records[first:]
+    return result, made
+
+
+def collected(results):
+    """Results of worker_call(), adding the workers' records to this process's"""
+    for result, made in results:
+        records.extend(made)
+        yield result
+
+
+def start(cprofile=None):
+    global enabled, profiler
+    enabled = True
+    records.clear()
+    if cprofile:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+
+def summary(slowest=5):
+    totals = defaultdict(lambda: [0, 0.0, 0.0, 0.0])  # calls, wall, cpu, longest
+    for record in records:
+        total = totals[(record.category, record.name)]
+        total[0] += 1
+        total[1] += record.wall
+        total[2] += record.cpu
+        total[3] = max(total[3], record.wall)
+    lines = [f"{'category':<12} {'name':<40} {'calls':>6} {'wall':>9} {'cpu':>9} {'longest':>9}"]
+    for (category, name), (calls, wall, cpu, longest) in sorted(
+            totals.items(), key=lambda item: (item[0][0], -item[1][1])):
+        lines.append(f"{category:<12} {name:<40} {calls:>6} {wall:>8.3f}s {cpu:>8.3f}s "
+                     f"{longest:>8.3f}s")
+    tools = sorted((r for r in records if r.category == "subprocess"), key=lambda r: -r.wall)
+    if tools:
+        lines.append("\nSlowest external commands:")
+        lines.extend(f"{r.wall:8.3f}s  {r.args['command']}" for r in tools[:slowest])
+    return "\n".join(lines)
+
+
+def chrome_trace():
+    """The records in Chrome's Trace Event Format"""
+    origin = min((r.start for r in records), default=0)
+    return {
+        "traceEvents": [
+            {"name": r.name, "cat": r.category, "ph": "X", "pid": r.pid, "tid": r.tid,
+             "ts": round((r.start - origin) * 1e6), "dur": round(r.wall * 1e6),
+             "args": dict(r.args, cpu=round(r.cpu, 6))}
+            for r in records],
+        "displayTimeUnit": "ms",
+    }
+
+
+def finish(output=None, cprofile=None):
+    """Stop profiling, print the summary and write the requested files"""
+    global enabled, profiler
+    enabled = False
+    if profiler:
+        profiler.disable()
+        profiler.dump_stats(cprofile)
+        print(f"cProfile stats written to {cprofile}")
+        profiler = None
+    print(f"\n{summary()}")
+    if output:
+        with open(output, "w") as trace:
+            json.dump(chrome_trace(), trace)
+        print(f"Trace written to {output}")
@@ -0,0 +1,112 @@
+"""
+What the book-wide validators need from each atom: its title and anchor
+(for cross-links), the symbols in its listings (for ticked words) and its
+example sluglines (for duplicate names). Cached in data/project_index.json
+by each atom's modification time and size, so only new or changed atoms are
+read; for the rest, building the book-wide indexes costs a stat() per atom.
+"""
+import json
+from collections import namedtuple
+
+import book_builder.config as config
+import book_builder.data_files as data_files
+import book_builder.markdown_tokens as tokens
+from book_builder.corpus import Corpus
+from book_builder.crosslinks import CrossLinkIndex
+from book_builder.duplicates import DuplicateIndex
+from book_builder.symbols import Declaration, SymbolIndex, atom_symbols
+
+
+class AtomFacts(namedtuple("AtomFacts", "name stem title heading anchor symbols sluglines")):
+    """
+    Enough of an Atom for CrossLinkIndex. 'symbols' holds (identifiers,
+    declarations, packages, imports) for each listing; 'sluglines' holds
+    (slug, line) for each example.
+    """
+    __slots__ = ()
+
+
+def facts_of(atom):
+    sluglines = []
+    for listing in atom.listings:
+        path = tokens.slug_path(listing.code.split("\n", 1)[0], ["//"])
+        if path:
+            sluglines.append((path, listing.line + 2))
+    return AtomFacts(atom.name, atom.stem, atom.title, atom.heading, atom.anchor,
+                     atom_symbols(atom), sluglines)
+
+
+def to_json(facts):
+    return dict(facts._asdict(), symbols=[
+        [sorted(identifiers), [list(d) for d in declarations], packages, imports]
+        for identifiers, declarations, packages, imports in facts.symbols])
+
+
+def from_json(entry):
+    return AtomFacts(**dict(entry, symbols=[
+        (frozenset(identifiers), [Declaration(*d) for d in declarations], packages, imports)
+        for identifiers, declarations, packages, imports in entry["symbols"]],
+        sluglines=[tuple(s) for s in entry["sluglines"]]))
+
+
+class ProjectIndex:
+    path = config.data_path / "project_index.json"
+
+    def __init__(self, directory=None):
+        self.corpus = Corpus.of(directory)
+        self.entries = None  # {atom name: {"signature": ..., "facts": ...}}
+        self.facts = {}  # AtomFacts, for entries already converted
+        self.changed = False
+
+    def _load(self):
+        self.entries = {}
+        if self.path.exists():
+            try:
+                self.entries = json.loads(self.path.read_text(encoding="utf-8"))
+            except ValueError:
+                print(f"Ignoring corrupt {self.path.name}")
+
+    def atom(self, name):
+        """AtomFacts for the atom, reading it only if it's new or has changed"""
+        if self.entries is None:
+            self._load()
+        stat = (self.corpus.directory / name).stat()
+        signature = [stat.st_mtime_ns, stat.st_size]
+        entry = self.entries.get(name)
+        if entry is None or entry["signature"] != signature:
+            atom = self.corpus[name]
+            facts = self.facts[name] = facts_of(atom)
+            self.entries[name] = {"signature": list(atom.signature), "facts": to_json(facts)}
+            self.changed = True
+        elif name not in self.facts:
+            self.facts[name] = from_json(entry["facts"])
+        return self.facts[name]
+
+    def atoms(self, pattern="*.md"):
+        """AtomFacts for every atom matching pattern, saving any changes"""
+        names = self.corpus.file_names(pattern)
+        result = [self.atom(name) for name in names]
+        if self.changed:
+            if pattern == "*.md":  # Forget atoms that are gone
+                for name in set(self.entries) - set(names):
+                    del self.entries[name]
+                    self.facts.pop(name, None)
+            data_files.replace(self.path, json.dumps(self.entries))
+            self.changed = False
+        return result
+
+    def crosslinks(self):
+        return CrossLinkIndex(self.atoms())
+
+    def symbols(self):
+        index = SymbolIndex()
+        for facts in self.atoms():
+            for symbols in facts.symbols:
+                index.add(facts.name, symbols)
+        return index
+
+    def example_sluglines(self):
+        """Like duplicates.example_sluglines()"""
+        return DuplicateIndex((slug, f"{facts.name}:{line}")
+                              for facts in self.atoms("[0-9]*_*.md")
+                              for slug, line in facts.sluglines)
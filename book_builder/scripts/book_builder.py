@@ -1,12 +1,14 @@
 # The driver script for the main program
 import os
-import re
 from pathlib import Path
 
 import click
 
 import book_builder.config as config
 import book_builder.examples as examples
+import book_builder.profiling as profiling
+import book_builder.markdown_tokens as tokens
+from book_builder.corpus import Corpus
 import book_builder.util as util
 import book_builder.validate as _validate
 import book_builder.zubtools
@@ -16,6 +18,7 @@ from book_builder.leanpub import generate_leanpub_manuscript
 from book_builder.leanpub import generate_print_ready_manuscript
 from book_builder.leanpub import git_commit_leanpub
 from book_builder.renumber_atoms import fix_names_and_renumber_atoms
+from book_builder.scripts.validator_commands import add_validator_commands
 from book_builder.solution_extractor import display_unconverted_solutions, extract_all_exercises
 from book_builder.solution_extractor import extract_unconverted_solutions
 from book_builder.style import fix_missing_function_parens
@@ -25,11 +28,20 @@ from book_builder.website import update_website_repo
 
 @click.group()
 @click.version_option()
-def cli():
+@click.option('--profile', is_flag=True,
+              help='Time validators, external tools, copies and targets, and show a summary.')
+@click.option('--profile-output', type=click.Path(),
+              help='Also write the timings here as a Chrome trace (JSON).')
+@click.option('--cprofile', type=click.Path(), help='Also write cProfile stats here.')
+@click.pass_context
+def cli(ctx, profile, profile_output, cprofile):
     """Book Builder
 
     Provides all book building and testing utilities under a single central command.
     """
+    if profile or profile_output or cprofile:
+        profiling.start(cprofile)
+        ctx.call_on_close(lambda: profiling.finish(profile_output, cprofile))
 
 
 ##########################################################
@@ -94,6 +106,33 @@ def without_duplicates():
         click.echo(examples.create_tasks_for_gradle(check_for_duplicates=True))
 
 
+@code.command('test')
+@click.argument('packages', nargs=-1)
+@click.option('--jobs', default=0, help='Number of examples to build at once (0 uses all cores).')
+@click.option('--timeout', default=60, help='Seconds allowed to compile, and to run, each example.')
+@click.option('--no-cache', is_flag=True, help='Rebuild examples even if they are unchanged.')
+@click.option('--stub', is_flag=True, help='Use a stand-in compiler instead of the real toolchain.')
+@click.option('--report', type=click.Path(), help='Where to write the JSON report.')
+def code_test(packages, jobs, timeout, no_cache, stub, report):
+    """Compile and run extracted examples (optionally only PACKAGES)"""
+    from book_builder.example_harness import report_path, test_examples
+    click.echo(test_examples(packages, jobs, timeout, not no_cache, stub,
+                             Path(report) if report else report_path))
+
+
+@code.command('example_names')
+@click.option('--export', type=click.Path(), help='Also write every slugline and its locations here.')
+def example_names(export):
+    """Report example sluglines and names that appear more than once"""
+    from book_builder.duplicates import example_sluglines
+    sluglines = example_sluglines()
+    click.echo(sluglines.report("Duplicate example sluglines"), nl=False)
+    click.echo(sluglines.by(lambda slug: slug.split('/')[-1])
+               .report("Duplicate example names"), nl=False)
+    if export:
+        click.echo(sluglines.export(Path(export)))
+
+
 @code.command('exec_run_sh')
 def code_exec_run_sh():
     """Make run.sh files executable via git"""
@@ -103,19 +142,43 @@ def code_exec_run_sh():
 ################### Validation ###########################
 
 @cli.group()
-def validate():
+@click.option('--jobs', default=1, help='Number of processes to validate with (0 uses all cores).')
+@click.option('--no-cache', is_flag=True, help='Revalidate atoms even if they are unchanged.')
+@click.option('--jsonl', type=click.Path(), help='Write the findings here as JSON Lines.')
+@click.option('--sarif', type=click.Path(), help='Write the findings here as SARIF.')
+@click.option('--junit', type=click.Path(), help='Write the findings here as JUnit XML.')
+@click.option('--changed-since', metavar='REF',
+              help='Only validate atoms changed since this git commit (book-wide checks still '
+                   'cover the whole book).')
+@click.option('--staged', is_flag=True, help='Only validate atoms staged for commit.')
+@click.pass_context
+def validate(ctx, jobs, no_cache, jsonl, sarif, junit, changed_since, staged):
     """Validation testing"""
+    _validate.Validator.jobs = jobs
+    _validate.Validator.use_cache = not no_cache
+    # For the subcommand alone, so nothing carries over to the next command in 'bb serve':
+    ctx.obj = dict(
+        changed=(_validate.changed_atoms(changed_since, staged)
+                 if changed_since or staged else None),
+        reports={report_format: path for report_format, path in
+                 [("jsonl", jsonl), ("sarif", sarif), ("junit", junit)] if path})
 
 
 @validate.command()
 @click.option('--trace', default="")
-def all(trace):
+@click.pass_obj
+def all(options, trace):
     """Run all tests"""
-    click.echo(_validate.Validator.all_checks(trace))
+    click.echo(_validate.Validator.all_checks(trace, **options))
+
+
+@validate.command('clear_cache')
+def clear_cache():
+    """Remove cached validation results"""
+    click.echo(_validate.ValidationCache.clear())
 
 
-gen_validators = Path(__file__).parent.parent / "generated_validators.py"
-exec(gen_validators.read_text())
+add_validator_commands(validate)
 
 
 ###################### Style #############################
@@ -186,6 +249,19 @@ def update_website():
     click.echo(git_commit_website())
 
 
+###################### Server ############################
+
+@cli.command()
+@click.option('--port', default=8791,
+              help='Local port for bbc client commands, where there are no Unix sockets.')
+@click.option('--interval', default=0.5, help='Seconds between checks for changes.')
+@click.option('--extract', is_flag=True, help='Also re-extract examples when atoms change.')
+def serve(port, interval, extract):
+    """Watch the book and rebuild on changes; run bbc commands warm"""
+    from book_builder.server import serve as serve_book
+    click.echo(serve_book(cli, port, interval, extract))
+
+
 ##########################################################
 
 @cli.group()
@@ -292,14 +368,12 @@ def fix_crosslinks():
 @z.command()
 def notes():
     """Show all {{ Notes }} and incomplete atoms"""
-    for md in config.markdown_dir.glob("*.md"):
-        text = md.read_text()
-        curly_notes = set(re.findall("{{.*?}}", text, flags=re.DOTALL))
-        curly_notes.discard("{{SAMPLE_END}}")
-        if "This Atom is Incomplete" in text:
+    for atom in Corpus.of().atoms():
+        curly_notes = {note.text for note in atom.spans_of(tokens.NOTE)}
+        if "This Atom is Incomplete" in atom.text:
             curly_notes.add("This Atom is Incomplete")
         if curly_notes:
-            print(md.name, end=': ')
+            print(atom.name, end=': ')
             for cn in curly_notes:
                 print(cn)
             print("-" * 40)
@@ -316,10 +390,19 @@ def imports_and_packages():
 @z.command()
 def classes():
     """
-    One of each import/package statement in the book
+    Every top-level class in the book's examples
     """
     click.echo(book_builder.zubtools.find_classes())
 
+
+@z.command()
+@click.argument('name')
+def symbol(name):
+    """
+    Where NAME is declared and used in the book's listings
+    """
+    click.echo(book_builder.zubtools.find_symbol(name))
+
 # @z.command()
 # def test():
 #     """Perform current test"""
@@ -3,17 +3,28 @@
 # of that example, placed in the 'generated' subdirectory
 import os
 import subprocess
+import tempfile
 from pathlib import Path
 import click
 import book_builder.config as config
 import book_builder.util as util
+from book_builder.example_harness import BatchRunner, toolchain_for
 
 
-def generate_example(source_file):
-    "Compile and capture results, create new source file with output appended"
+def generated_dir():
     gen = Path.cwd() / "generated"
     if not gen.exists():
         gen.mkdir()
+    return gen
+
+
+def entry_point(source_file):
+    return f"{source_file.parent.stem}.{source_file.stem + 'Kt'}"
+
+
+def generate_example(source_file):
+    "Compile and capture results, create new source file with output appended"
+    generated_dir()
     def execute(cmd):
         result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, shell=True)
         out = result.stdout.decode('utf-8')
@@ -25,11 +36,14 @@ def generate_example(source_file):
     compiler_out, compiler_err = execute(["kotlinc", f"{source_file.name}"])
     if "error" in compiler_err:
         return None
-    run_out, run_err = execute(
-        ["kotlin", f"{source_file.parent.stem}.{source_file.stem + 'Kt'}"])
+    run_out, run_err = execute(["kotlin", entry_point(source_file)])
     if "error" in run_err:
         return None
+    return write_generated(source_file, run_out)
+
 
+def write_generated(source_file, run_out):
+    "Create new source file with run_out appended"
     def chop_output(source_path):
         lines = source_path.read_text().strip().splitlines()
         for n, line in enumerate(lines):
@@ -41,12 +55,72 @@ def generate_example(source_file):
     source_code = chop_output(source_file)
     if len(run_out):
         source_code += f"\n/* Output:\n{run_out.strip()}\n*/"
-    generated_example = gen / source_file.name
+    generated_example = generated_dir() / source_file.name
     generated_example.write_text(source_code)
     print(f"wrote {generated_example.relative_to(Path.cwd())}")
     return generated_example
 
 
+def compile_batch(source_files, toolchain, out_dir):
+    """
+    Compile all source_files with one compiler invocation. Returns the ones
+    that compiled; if the batch fails, compiles each file on its own to
+    find them, the same as compiling them one at a time.
+    """
+    def compiles(sources):
+        result = subprocess.run(toolchain.compile_batch(sources, out_dir),
+                                stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        err = result.stderr.decode('utf-8')
+        if len(err):
+            print(f"{err}")
+        return "error" not in err
+
+    if compiles(source_files):
+        return set(source_files)
+    print("Batch compile failed, compiling files separately")
+    return {source_file for source_file in source_files if compiles([source_file])}
+
+
+def run_separately(toolchain, out_dir, name):
+    """Run one compiled main() in its own process; returns (status, stdout, stderr)"""
+    result = subprocess.run(toolchain.run(out_dir, name), cwd=str(Path.cwd()),
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    return (result.returncode, result.stdout.decode('utf-8', 'replace'),
+            result.stderr.decode('utf-8', 'replace'))
+
+
+def generate_batch(source_files, toolchain):
+    """
+    Like generate_example() for each of source_files, but starts the compiler
+    once for all of them, then runs every main() in one long-lived runner.
+    A main() that ends the runner, by calling exit() for example, is run
+    again in a process of its own. Because the runner is shared, static and
+    object state can leak from one example to the next. Returns the
+    generated files, with None for each file that failed.
+    """
+    generated_dir()
+    generated = []
+    with tempfile.TemporaryDirectory() as out_dir:
+        compiled = compile_batch(source_files, toolchain, out_dir)
+        with BatchRunner(toolchain.batch_runner(out_dir), Path.cwd()) as runner:
+            for source_file in source_files:
+                if source_file not in compiled:
+                    generated.append(None)
+                    continue
+                result = runner.run(entry_point(source_file))
+                if result is None:  # It exited the runner, so give it a process of its own
+                    print(f"{source_file.name} ended the batch runner, running it separately")
+                    result = run_separately(toolchain, out_dir, entry_point(source_file))
+                _, run_out, run_err = result
+                if len(run_err):
+                    print(f"{run_err}")
+                if "error" in run_err:
+                    generated.append(None)
+                    continue
+                generated.append(write_generated(source_file, run_out))
+    return generated
+
+
 def reinsert_file(generated_file):
     generated = generated_file.read_text()
     lines = generated.splitlines()
@@ -80,7 +154,10 @@ def process_file(source_file, reinsert):
 @click.argument('kotlin_files', nargs=-1)
 @click.option('--reinsert', is_flag=True, help='Insert result back into md file.')
 @click.option('--edit', is_flag=True, help='Open file(s) in editor after processing.')
-def generate(kotlin_files, reinsert, edit):
+@click.option('--batch', is_flag=True,
+              help='Compile all files at once and run them in one process.')
+@click.option('--stub', is_flag=True, help='Batch mode using a stand-in compiler and runner.')
+def generate(kotlin_files, reinsert, edit, batch, stub):
     """
     Takes kotlin files, compiles and runs them, then creates new files with
     the output appended. With no arguments, does all files in this directory.
@@ -89,7 +166,14 @@ def generate(kotlin_files, reinsert, edit):
         [Path.cwd() / kf for kf in kotlin_files] if kotlin_files
         else Path.cwd().glob("*.kt") # No arguments, do them all
     )
-    generated_files = filter(None, [process_file(gf, reinsert) for gf in source_files])
+    if batch or stub:
+        generated_files = list(filter(None, generate_batch(
+            list(source_files), toolchain_for("kotlin", stub))))
+        if reinsert:
+            for gf in generated_files:
+                reinsert_file(gf)
+    else:
+        generated_files = filter(None, [process_file(gf, reinsert) for gf in source_files])
     if edit:
         for gf in generated_files:
             os.system(f"{config.editor} {gf}")
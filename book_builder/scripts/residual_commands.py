@@ -1,11 +1,10 @@
 # The driver script for the main program
-from pathlib import Path
-
 import click
 
 import book_builder.config as config
 import book_builder.examples as examples
 import book_builder.packages as _packages
+import book_builder.profiling as profiling
 import book_builder.util as util
 import book_builder.validate as _validate
 import book_builder.zubtools
@@ -14,16 +13,26 @@ from book_builder.ebook_generators import convert_to_epub
 from book_builder.ebook_generators import convert_to_mobi
 from book_builder.ebook_generators import create_release
 from book_builder.ebook_generators import generate_epub_bug_demo_file
-from book_builder.html_generator import convert_to_html
+from book_builder.html_generator import convert_to_html, html_cache_dir
+from book_builder.scripts.validator_commands import add_validator_commands
 
 
 @click.group()
 @click.version_option()
-def cli():
+@click.option('--profile', is_flag=True,
+              help='Time validators, external tools, copies and targets, and show a summary.')
+@click.option('--profile-output', type=click.Path(),
+              help='Also write the timings here as a Chrome trace (JSON).')
+@click.option('--cprofile', type=click.Path(), help='Also write cProfile stats here.')
+@click.pass_context
+def cli(ctx, profile, profile_output, cprofile):
     """Book Builder
 
     Provides all book building and testing utilities under a single central command.
     """
+    if profile or profile_output or cprofile:
+        profiling.start(cprofile)
+        ctx.call_on_close(lambda: profiling.finish(profile_output, cprofile))
 
 
 ##########################################################
@@ -84,8 +93,7 @@ def all(trace):
     click.echo(_validate.Validator.all_checks(trace))
 
 
-gen_validators = Path(__file__).parent.parent / "generated_validators.py"
-exec(gen_validators.read_text())
+add_validator_commands(validate)
 
 
 ##########################################################
@@ -117,9 +125,10 @@ def epub_regen():
 
 
 @epub.command('build')
-def epub_build():
+@click.option('--jobs', default=0, help='Number of tools to run at once (0 uses all cores).')
+def epub_build(jobs):
     """Create epub from Markdown files"""
-    click.echo(convert_to_epub())
+    click.echo(convert_to_epub(jobs))
 
 
 @epub.command('bugdemo')
@@ -137,9 +146,10 @@ def mobi():
 
 
 @mobi.command('build')
-def mobi_build():
+@click.option('--jobs', default=0, help='Number of tools to run at once (0 uses all cores).')
+def mobi_build(jobs):
     """Create epub from Markdown files"""
-    click.echo(convert_to_mobi())
+    click.echo(convert_to_mobi(jobs))
 
 
 ##########################################################
@@ -172,27 +182,31 @@ def html_clean():
     remove(config.html_sample_dir)
     remove(config.html_complete_dir)
     remove(config.html_stripped_dir)
+    remove(html_cache_dir)
 
 
 @html.command('sample')
-def html_build_sample():
+@click.option('--jobs', default=0, help='Number of pages to render at once (0 uses all cores).')
+def html_build_sample(jobs):
     """Create sample html from Markdown files"""
-    click.echo(convert_to_html(config.html_sample_dir, sample=True))
+    click.echo(convert_to_html(config.html_sample_dir, sample=True, workers=jobs))
 
 
 @html.command('complete')
-def html_build_complete():
+@click.option('--jobs', default=0, help='Number of pages to render at once (0 uses all cores).')
+def html_build_complete(jobs):
     """Create complete html from Markdown files"""
-    click.echo(convert_to_html(config.html_complete_dir, sample=False))
+    click.echo(convert_to_html(config.html_complete_dir, sample=False, workers=jobs))
 
 
 ##########################################################
 
 
 @cli.command()
-def release():
+@click.option('--jobs', default=0, help='Number of tools to run at once (0 uses all cores).')
+def release(jobs):
     """Create full release from scratch"""
-    click.echo(create_release())
+    click.echo(create_release(jobs))
 
 
 ##########################################################
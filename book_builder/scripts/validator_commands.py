@@ -0,0 +1,27 @@
+"""
+Adds a command to a click group for each Validator, from the validator's
+command_name and docstring. Validators don't load their data files or
+book-wide indexes until they run, so building the commands is cheap.
+"""
+import inspect
+
+import click
+
+import book_builder.validate as _validate
+
+
+def validator_command(validator):
+    @click.pass_context
+    def check(ctx, trace):
+        # The group's options, or none where the group doesn't have any:
+        click.echo(_validate.Validator.one_check(validator, trace, **(ctx.obj or {})))
+
+    return click.Command(
+        validator.command_name.replace("_", "-"), callback=check,
+        params=[click.Option(['--trace'], default="")],
+        help=inspect.cleandoc(validator.__doc__))
+
+
+def add_validator_commands(group):
+    for validator in _validate.Validator.__subclasses__():
+        group.add_command(validator_command(validator))
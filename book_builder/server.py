@@ -0,0 +1,230 @@
+"""
+Long-running build server for 'bb serve'. Keeps the book loaded in a warm
+process, watches Markdown/, resources/ and data/ for changes and re-runs only
+what a change affects. Also answers bb commands sent by the 'bbc' client over
+a local socket, so they run without Python startup or reloading the book.
+The socket is a Unix domain socket in data/ that only its owner can use;
+where there aren't any (older Windows), it's a TCP port on localhost.
+"""
+import contextlib
+import io
+import json
+import os
+import signal
+import socket
+import socketserver
+import sys
+import time
+import traceback
+
+import click
+
+import book_builder.config as config
+import book_builder.examples as examples
+import book_builder.validate as validate
+from book_builder.corpus import Corpus
+from book_builder.util import pushd
+
+port_file = config.data_path / "bb_server.port"
+socket_file = config.data_path / "bb_server.sock"
+default_port = 8791
+
+
+class PollingWatcher:
+    """Detects changed files by comparing modification times and sizes"""
+
+    def __init__(self, directories):
+        self.directories = [d for d in directories if d.exists()]
+        self.snapshot = self.scan()
+
+    def scan(self):
+        result = {}
+        for directory in self.directories:
+            for path in directory.rglob("*"):
+                with contextlib.suppress(OSError):
+                    if path.is_file():
+                        stat = path.stat()
+                        result[path] = (stat.st_mtime_ns, stat.st_size)
+        return result
+
+    def changes(self):
+        """Paths added, removed or modified since the last call"""
+        current = self.scan()
+        changed = {path for path in current.keys() | self.snapshot.keys()
+                   if current.get(path) != self.snapshot.get(path)}
+        self.snapshot = current
+        return changed
+
+
+class InotifyWatcher:
+    """Uses Linux inotify through the optional inotify_simple package"""
+
+    def __init__(self, directories):
+        from inotify_simple import INotify, flags
+        self.flags = flags
+        self.mask = (flags.CREATE | flags.MODIFY | flags.DELETE | flags.CLOSE_WRITE |
+                     flags.MOVED_FROM | flags.MOVED_TO)
+        self.inotify = INotify()
+        self.watched = {}  # Directory for each watch descriptor
+        for directory in directories:
+            if directory.exists():
+                self.watch(directory)
+
+    def watch(self, directory):
+        for d in [directory] + [p for p in directory.rglob("*") if p.is_dir()]:
+            self.watched[self.inotify.add_watch(str(d), self.mask)] = d
+
+    def changes(self):
+        changed = set()
+        for event in self.inotify.read(timeout=0):
+            if event.wd not in self.watched:
+                continue
+            path = self.watched[event.wd] / event.name
+            if event.mask & self.flags.ISDIR:
+                if event.mask & (self.flags.CREATE | self.flags.MOVED_TO):
+                    self.watch(path)
+                continue
+            changed.add(path)
+        return changed
+
+
+def create_watcher(directories):
+    try:
+        return InotifyWatcher(directories)
+    except (ImportError, OSError):
+        return PollingWatcher(directories)
+
+
+class CommandHandler(socketserver.StreamRequestHandler):
+    """
+    Runs a single bb command. The client sends {"cwd": ..., "args": [...]}
+    as JSON on one line, and receives everything the command prints. The
+    command runs in the client's directory, so relative paths are its own.
+    """
+
+    def handle(self):
+        request = json.loads(self.rfile.readline().decode("utf-8"))
+        args = request["args"]
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output), contextlib.redirect_stderr(output):
+            if args[:1] == ["serve"]:
+                print("The server is already running")
+            else:
+                self.server.build_server.run_command(args, request["cwd"])
+        self.wfile.write(output.getvalue().encode("utf-8"))
+
+
+class BuildServer:
+    def __init__(self, cli, port, interval, extract):
+        self.cli = cli
+        self.interval = interval
+        self.extract = extract
+        self.watched = {
+            "markdown": config.markdown_dir,
+            "resources": config.root_path / "resources",
+            "data": config.data_path,
+        }
+        self.watcher = create_watcher(self.watched.values())
+        self.socket_server = self.create_socket_server(port)
+        self.socket_server.timeout = interval
+        self.socket_server.build_server = self
+        self.own_writes = {}  # Data files as the server last wrote them
+
+    @staticmethod
+    def create_socket_server(port):
+        if not hasattr(socket, "AF_UNIX"):
+            return socketserver.TCPServer(("127.0.0.1", port), CommandHandler)
+        if socket_file.exists():
+            socket_file.unlink()  # Left behind by a server that was killed
+        old_umask = os.umask(0o177)  # Created with 0600 permissions
+        try:
+            return socketserver.UnixStreamServer(str(socket_file), CommandHandler)
+        finally:
+            os.umask(old_umask)
+
+    def run_command(self, args, cwd):
+        with pushd(cwd):  # Back to the server's directory afterwards
+            try:
+                self.cli.main(args, prog_name="bb", standalone_mode=False)
+            except click.ClickException as e:
+                e.show()
+            except (click.Abort, SystemExit):
+                pass
+            except Exception:
+                traceback.print_exc()
+        self.remember_own_writes()
+
+    def affected(self, changed, name):
+        directory = self.watched[name]
+        return [path for path in changed if directory in path.parents]
+
+    @staticmethod
+    def validator_data_files():
+        return {data.ef_path for v in validate.Validator.__subclasses__()
+                for data in vars(v).values()
+                if isinstance(data, (validate.Data, validate.Exclusions))}
+
+    @staticmethod
+    def signature(path):
+        with contextlib.suppress(OSError):
+            stat = path.stat()
+            return stat.st_mtime_ns, stat.st_size
+        return None
+
+    def remember_own_writes(self):
+        """So the data files the server just wrote aren't taken as edits"""
+        self.own_writes = {path: self.signature(path) for path in self.validator_data_files()}
+
+    def rebuild(self, changed):
+        """Re-run only what the changed files affect"""
+        edited = [path for path in set(self.affected(changed, "data")) & self.validator_data_files()
+                  if self.signature(path) != self.own_writes.get(path)]
+        if edited:
+            validate.forget_data_files()
+            print(f"Reloading {', '.join(sorted(path.name for path in edited))}")
+        atoms = [path for path in self.affected(changed, "markdown")
+                 if path.suffix == ".md" and path.exists()]
+        if atoms:
+            start = time.time()
+            validate.CrossLinks.index = validate.project_index().crosslinks()
+            validate.TickedWords.index = validate.project_index().symbols()
+            validators = [v("") for v in validate.Validator.__subclasses__()]
+            numbered = [path for path in atoms if path.name[:1].isdigit()]
+            validate.Validator.check_files(validators, "", numbered, post_process=False)
+            validate.editor.data_files.clear()
+            validate.editor.markdown_files.clear()
+            self.remember_own_writes()
+            if self.extract:
+                print(examples.extractExamples())
+            print(f"[{', '.join(sorted(p.name for p in atoms))}: "
+                  f"{time.time() - start:.2f}s]")
+        for path in self.affected(changed, "resources"):
+            print(f"Resource changed: {path.name}")
+
+    def serve_forever(self):
+        if isinstance(self.socket_server, socketserver.UnixStreamServer):
+            listening = socket_file.name
+        else:
+            port_file.write_text(str(self.socket_server.server_address[1]))
+            listening = f"port {self.socket_server.server_address[1]}"
+        print(f"Serving {config.root_path} on {listening} ({type(self.watcher).__name__})")
+        Corpus.of().atoms()  # Warm up
+        self.remember_own_writes()
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit("Server terminated"))
+        try:
+            while True:
+                self.socket_server.handle_request()
+                changed = self.watcher.changes()
+                if changed:
+                    self.rebuild(changed)
+        except KeyboardInterrupt:
+            return "Server stopped"
+        finally:
+            self.socket_server.server_close()
+            for path in (port_file, socket_file):
+                if path.exists():
+                    path.unlink()
+
+
+def serve(cli, port=default_port, interval=0.5, extract=False):
+    return BuildServer(cli, port, interval, extract).serve_forever()
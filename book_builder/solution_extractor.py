@@ -2,6 +2,8 @@ from collections import deque
 from pathlib import Path
 
 import book_builder.config as config
+import book_builder.markdown_tokens as tokens
+from book_builder.corpus import text_of
 import book_builder.util as util
 
 exercises_repo = Path("C:/Git/AtomicKotlinExercises")
@@ -23,14 +25,15 @@ def extract(lines: deque, start: str) -> (str, str):
 class ExercisesAndSolutions:
     def __init__(self, md: Path):
         self.md = md
-        self.atom = md.read_text()
+        self.atom = text_of(md)
         self.atom_lines = self.atom.splitlines()
         self.directory_name = md.stem
         self.directory = exercises_repo / self.directory_name
-        self.contains_exercises = config.exercise_header in self.atom_lines
+        exercise_blocks = tokens.spans_of(tokens.EXERCISES, self.atom)
+        self.contains_exercises = bool(exercise_blocks)
         if not self.contains_exercises:
             return
-        self.exercises = self.atom.split(config.exercise_header)[1]
+        self.exercises = exercise_blocks[0].text[len(config.exercise_header):]
         self.exercise_lines = self.exercises.splitlines()
         self.exercise_descriptions = {}
         self.exercise_solutions = {}
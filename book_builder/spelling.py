@@ -0,0 +1,141 @@
+"""
+Spell checking. The word lists are compiled into a pickled frozenset, which
+is only rebuilt when one of the word list files changes, so loading the
+dictionary doesn't re-split the text files each time. Atoms are checked in
+a single pass, which can skip code listings and `ticked` code. Misspellings
+get suggestions from a symmetric-delete index: every word is stored under
+each string formed by deleting one of its characters, so a misspelling only
+needs to look up its own deletions to find the words within an edit or two.
+"""
+import os
+import pickle
+import re
+from collections import defaultdict
+from functools import lru_cache
+
+import book_builder.config as config
+import book_builder.markdown_tokens as tokens
+from book_builder.validation_cache import digest
+
+word = re.compile(r"[a-zA-Z]+(?:'[a-zA-Z]+)*")
+# `Ticked` text is matched (and then ignored) in the same pass as the words:
+word_or_ticked = re.compile(r"(`+).+?\1|(?P<word>[a-zA-Z]+(?:'[a-zA-Z]+)*)", flags=re.DOTALL)
+
+
+@lru_cache(maxsize=1024)
+def words_in(text, code=False):
+    """
+    The set of words in an atom: every word in it if code is True, otherwise
+    only those in the prose and headers, skipping listings and `ticked` text.
+    """
+    if code:
+        return frozenset(word.findall(text))
+    found = set()
+    for span in tokens.tokenize(text):
+        if span.kind in (tokens.PROSE, tokens.HEADER):
+            found.update(match.group("word") for match in word_or_ticked.finditer(span.text))
+    found.discard(None)
+    return frozenset(found)
+
+
+def deletions(term):
+    """term, and term with each one of its characters deleted"""
+    return {term} | {term[:n] + term[n + 1:] for n in range(len(term))}
+
+
+def edit_distance(a, b):
+    """Insertions, deletions, substitutions and adjacent transpositions"""
+    previous2, previous = None, list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            current[j] = min(previous[j] + 1, current[j - 1] + 1,
+                             previous[j - 1] + (a[i - 1] != b[j - 1]))
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        previous2, previous = previous, current
+    return previous[-1]
+
+
+class Dictionary:
+    """
+    The words in the word list files, loaded from a compiled copy in
+    data_path when that's up to date. Reloads itself if a word list changes.
+    """
+
+    def __init__(self, *file_names):
+        self.sources = [config.data_path / name for name in file_names]
+        self.compiled = config.data_path / "spelling_dictionary.pickle"
+        self.suggestions_path = config.data_path / "spelling_suggestions.pickle"
+        self._words = None
+        self._index = None
+        self._signature = None
+
+    @property
+    def signature(self):
+        """Changes when any of the word list files change"""
+        return [(path.name, path.stat().st_mtime_ns, path.stat().st_size)
+                if path.exists() else (path.name, None, None) for path in self.sources]
+
+    @property
+    def digest(self):
+        return digest(*self.signature)
+
+    @property
+    def words(self):
+        signature = self.signature
+        if self._words is None or signature != self._signature:
+            self._signature = signature
+            self._index = None
+            self._words = self._load(self.compiled, signature, self._compile)
+        return self._words
+
+    def __contains__(self, term):
+        return term in self.words
+
+    def _compile(self):
+        words = set()
+        for path in self.sources:
+            if path.exists():
+                words.update(line.strip() for line in path.read_text().splitlines())
+        words.discard("")
+        return frozenset(words)
+
+    def _build_index(self):
+        index = defaultdict(list)
+        for term in self.words:
+            for deleted in deletions(term.lower()):
+                index[deleted].append(term)
+        return dict(index)
+
+    @staticmethod
+    def _load(path, signature, build):
+        """Unpickle path if it was built from signature, otherwise rebuild it"""
+        try:
+            with open(path, "rb") as compiled:
+                stored_signature, contents = pickle.load(compiled)
+            if stored_signature == signature:
+                return contents
+        except (OSError, EOFError, pickle.UnpicklingError, ValueError):
+            pass
+        contents = build()
+        temp = path.with_name(f"{path.name}.{os.getpid()}.tmp")  # Workers may race
+        with open(temp, "wb") as compiled:
+            pickle.dump((signature, contents), compiled, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(str(temp), str(path))
+        return contents
+
+    def misspelled(self, text, code=False):
+        """Sorted words in text that aren't in the dictionary"""
+        return sorted(words_in(text, code) - self.words)
+
+    def suggest(self, term, limit=3):
+        """The closest words to term, at most two edits away"""
+        self.words  # Reloads if stale
+        if self._index is None:
+            self._index = self._load(self.suggestions_path, self._signature, self._build_index)
+        lower = term.lower()
+        candidates = {w for deleted in deletions(lower) for w in self._index.get(deleted, ())}
+        candidates.discard(term)
+        ranked = sorted((edit_distance(lower, w.lower()), w) for w in candidates)
+        return [w for distance, w in ranked if distance <= 2][:limit]
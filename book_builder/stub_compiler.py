@@ -0,0 +1,112 @@
+#! py -3
+"""
+Stand-in for kotlinc/javac and kotlin/java, so the example harness can be
+exercised on machines without a JDK. "Compiling" checks that brackets
+balance and records each main's expected output (its /* Output: block);
+"running" a main class prints that recorded output.
+
+    stub_compiler.py -version
+    stub_compiler.py compile SOURCE... -d OUTDIR
+    stub_compiler.py run -classpath OUTDIR MAINCLASS
+    stub_compiler.py serve -classpath OUTDIR
+
+'serve' speaks the batch runner protocol (see example_harness.BatchRunner),
+running each main class named on stdin.
+
+Deliberately self-contained: it runs as a separate process and doesn't
+import book_builder.
+"""
+import sys
+from pathlib import Path
+
+version = "stub-compiler 1.0"
+brackets = {")": "(", "]": "[", "}": "{"}
+
+
+def unbalanced(code):
+    """Line number of the first mismatched bracket, or None"""
+    stack = []
+    for n, line in enumerate(code.splitlines(), 1):
+        if line.lstrip().startswith("//"):
+            continue
+        for ch in line:
+            if ch in "([{":
+                stack.append((ch, n))
+            elif ch in brackets:
+                if not stack or stack.pop()[0] != brackets[ch]:
+                    return n
+    return stack[-1][1] if stack else None
+
+
+def main_class(source, code):
+    packages = [line.split()[1].rstrip(";") for line in code.splitlines()
+                if line.startswith("package ")]
+    name = source.stem + "Kt" if source.suffix == ".kt" else source.stem
+    return f"{packages[0]}.{name}" if packages else name
+
+
+def expected_output(code):
+    lines = code.splitlines()
+    for n, line in enumerate(lines):
+        if line.startswith("/* Output:"):
+            return "\n".join(lines[n + 1:]).split("*/")[0]
+    return ""
+
+
+def compile_sources(sources, out_dir):
+    out_dir.mkdir(parents=True, exist_ok=True)
+    failed = False
+    for source in sources:
+        if not source.exists():
+            print(f"error: source file or directory not found: {source}", file=sys.stderr)
+            failed = True
+            continue
+        code = source.read_text()
+        line = unbalanced(code)
+        if line is not None:
+            print(f"{source.name}:{line}: error: unbalanced brackets", file=sys.stderr)
+            failed = True
+        elif "main(" in code:
+            (out_dir / f"{main_class(source, code)}.out").write_text(expected_output(code))
+    return 1 if failed else 0
+
+
+def run(class_path, name):
+    recorded = class_path / f"{name}.out"
+    if not recorded.exists():
+        print(f"error: could not find or load main class {name}", file=sys.stderr)
+        return 1
+    sys.stdout.write(recorded.read_text())
+    return 0
+
+
+def serve(class_path):
+    for line in sys.stdin.buffer:
+        name = line.decode("utf-8").strip()
+        recorded = class_path / f"{name}.out"
+        if recorded.exists():
+            status, out, err = 0, recorded.read_bytes(), b""
+        else:
+            status, out, err = 1, b"", f"error: could not find or load main class {name}\n".encode()
+        sys.stdout.buffer.write(f"{status} {len(out)} {len(err)}\n".encode() + out + err)
+        sys.stdout.buffer.flush()
+    return 0
+
+
+def main(args):
+    if args == ["-version"]:
+        print(version, file=sys.stderr)  # Like kotlinc
+        return 0
+    if args[:1] == ["compile"] and "-d" in args:
+        d = args.index("-d")
+        return compile_sources([Path(a) for a in args[1:d]], Path(args[d + 1]))
+    if args[:2] == ["run", "-classpath"] and len(args) == 4:
+        return run(Path(args[2]), args[3])
+    if args[:2] == ["serve", "-classpath"] and len(args) == 3:
+        return serve(Path(args[2]))
+    print(__doc__, file=sys.stderr)
+    return 2
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
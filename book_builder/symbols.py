@@ -0,0 +1,126 @@
+"""
+Index of the symbols in the book's code listings: every identifier, the
+classes, functions and properties each listing declares, and its package
+and import statements, each mapped to the atoms they appear in. Built once
+from the Corpus and shared by TickedWords and the zubtools reports, so a
+ticked word is checked against the whole book with a single lookup.
+"""
+import re
+from collections import defaultdict, namedtuple
+from functools import lru_cache
+
+import book_builder.markdown_tokens as tokens
+from book_builder.corpus import Corpus
+from book_builder.validation_cache import digest
+
+comment_or_string = re.compile(
+    r'//.*?$|/\*.*?\*/|\'(?:\\.|[^\\\'])*\'|"(?:\\.|[^\\"])*"',
+    re.DOTALL | re.MULTILINE)
+non_letters = re.compile("[^a-zA-Z]+")
+modifiers = ("public|private|protected|internal|open|abstract|sealed|data|enum|inner|"
+             "annotation|override|inline|suspend|static|final|operator|infix|tailrec|"
+             "external|companion|const|lateinit")
+declaration = re.compile(
+    rf"^(?P<indent>\s*)(?:(?:{modifiers})\s+)*"
+    r"(?P<kind>class|interface|object|enum|fun|val|var)\s+"
+    r"(?:<[^>]*>\s*)?(?:[A-Za-z_][\w.]*\.)?(?P<name>[A-Za-z_]\w*)")
+
+
+def without_comments(code):
+    """Replaces each comment with a space, leaving string literals alone"""
+    return comment_or_string.sub(
+        lambda match: " " if match.group(0).startswith("/") else match.group(0), code)
+
+
+class Declaration(namedtuple("Declaration", "kind name atom slug block")):
+    """
+    A class, interface, object, function or property declared in a listing.
+    'slug' is the listing's slugline (None for a fragment). 'block' is the
+    declaring line, followed by its body through the closing brace for a
+    top-level declaration ending with '{'.
+    """
+    __slots__ = ()
+
+
+def _block(lines, n):
+    if lines[n][:1].isspace() or not lines[n].rstrip().endswith("{"):
+        return lines[n]
+    for end in range(n + 1, len(lines)):
+        if lines[end].startswith("}"):
+            return "\n".join(lines[n:end + 1])
+    return lines[n]
+
+
+@lru_cache(maxsize=1024)
+def _listing_symbols(atom_name, code):
+    """(identifiers, declarations, packages, imports) for one listing"""
+    lines = code.splitlines()
+    slug = lines[0] if lines and tokens.slug_path(lines[0]) else None
+    identifiers = frozenset(non_letters.split(without_comments(code))) - {""}
+    declarations = []
+    packages = []
+    imports = []
+    for n, line in enumerate(lines):
+        if line.startswith("package "):
+            packages.append(line)
+        elif line.startswith("import "):
+            imports.append(line)
+        else:
+            match = declaration.match(line)
+            if match:
+                declarations.append(Declaration(
+                    match.group("kind"), match.group("name"), atom_name, slug, _block(lines, n)))
+    return identifiers, declarations, packages, imports
+
+
+def atom_symbols(atom):
+    """(identifiers, declarations, packages, imports) for each listing in atom"""
+    return [_listing_symbols(atom.name, listing.code) for listing in atom.listings]
+
+
+class SymbolIndex:
+    def __init__(self, atoms=()):
+        self.identifiers = defaultdict(set)  # Atom names for each identifier
+        self.declarations = defaultdict(list)  # Declarations of each name
+        self.packages = defaultdict(set)  # Atom names for each package statement
+        self.imports = defaultdict(set)  # Atom names for each import statement
+        self._digest = None
+        for atom in atoms:
+            for symbols in atom_symbols(atom):
+                self.add(atom.name, symbols)
+
+    def add(self, atom_name, symbols):
+        """Add the (identifiers, declarations, packages, imports) of one listing"""
+        identifiers, declarations, packages, imports = symbols
+        for identifier in identifiers:
+            self.identifiers[identifier].add(atom_name)
+        for declared in declarations:
+            self.declarations[declared.name].append(declared)
+        for package in packages:
+            self.packages[package].add(atom_name)
+        for imported in imports:
+            self.imports[imported].add(atom_name)
+        self._digest = None
+
+    @staticmethod
+    def of(directory=None):
+        """Index of the listings in directory (default: the book's Markdown)"""
+        return SymbolIndex(Corpus.of(directory).atoms())
+
+    @property
+    def digest(self):
+        """Changes when the set of identifiers changes"""
+        if self._digest is None:
+            self._digest = digest(*sorted(self.identifiers))
+        return self._digest
+
+    def __contains__(self, identifier):
+        return identifier in self.identifiers
+
+    def defined_in(self, name):
+        """
+        Sorted names of the atoms declaring name or, if it isn't declared,
+        the atoms whose listings use it
+        """
+        declared = {d.atom for d in self.declarations.get(name, ())}
+        return sorted(declared or self.identifiers.get(name, ()))
@@ -5,14 +5,14 @@ import shutil
 import sys
 import os
 import re
-import time
 from pathlib import Path
 from typing import List
-from distutils.dir_util import copy_tree
 from collections import OrderedDict
 import textwrap
 import book_builder.config as config
+import book_builder.profiling as profiling
 from book_builder.config import BookType
+from book_builder.corpus import Corpus
 import contextlib
 import os
 
@@ -50,13 +50,13 @@ def create_numbered_markdown_filename(h1, n):
 def header_to_filename_map(dir_to_map: Path):
     """Produces mapping between header/crosslink strings and file name bases"""
     result = dict()
-    for md in sorted(list(dir_to_map.glob("*.md"))):
-        if "000_Front.md" in md.name or "00_Front.md" in md.name:
+    for atom in Corpus.of(dir_to_map).atoms():
+        if "000_Front.md" in atom.name or "00_Front.md" in atom.name:
             continue
-        header = md.read_text().splitlines()[0].strip()
+        header = atom.title
         name_base = create_markdown_filename(header)[:-3]
-        assert name_base in md.name
-        result[header] = (name_base, md.stem)
+        assert name_base in atom.name
+        result[header] = (name_base, atom.stem)
     return result
 
 
@@ -74,12 +74,14 @@ def erase(dir_to_remove):
         print(e)
 
 
-def retain_files(target_dir: Path, extensions: List[str]):
+def retain_files(target_dir: Path, extensions: List[str], keep_names=()):
     """
-    Delete all files except those with 'extensions'
+    Delete all files except those with 'extensions', and the files and
+    directories named in 'keep_names'
     """
     all_ = set(target_dir.glob("*"))
     keep = {f for f in all_ for ext in extensions if f.name.endswith(ext)}
+    keep |= {f for f in all_ if f.name in keep_names}
     remove = all_ - keep
     # for k in keep:
     #     print(k.name)
@@ -94,16 +96,17 @@ if __name__ == '__main__':
     retain_files(config.mobi_build_dir, ["mobi"])
 
 
-def regenerate_ebook_build_dir(ebook_build_dir, ebook_type: BookType = BookType.EPUB):
-    erase(ebook_build_dir)
-    time.sleep(1)
-    os.makedirs(ebook_build_dir)
+def ebook_assets(ebook_type: BookType = BookType.EPUB):
+    """
+    The files an ebook build directory starts with, as
+    {path relative to the build directory: source path}
+    """
+    assets = {}
 
     def copy(src):
         source = Path(src)
         assert source.exists()
-        shutil.copy(src, ebook_build_dir)
-        assert (Path(ebook_build_dir) / source.name).exists()
+        assets[Path(source.name)] = source
 
     for font in config.fonts.glob("*.ttf"):
         copy(font)
@@ -120,12 +123,66 @@ def regenerate_ebook_build_dir(ebook_build_dir, ebook_type: BookType = BookType.
         copy(config.html_pandoc_template)
         copy(config.banner)
         copy(config.favicon)
-    dest_images = ebook_build_dir / "images"
-    copy_tree(str(config.images), str(dest_images))
-    for f in dest_images.rglob("*.graffle"):
-        f.unlink()
-
     # copy(config.metadata)
+    for directory, dirs, files in os.walk(str(config.images)):
+        dirs[:] = [d for d in dirs if not d.endswith(".graffle")]  # Mac bundles
+        for name in files:
+            if not name.endswith(".graffle"):
+                source = Path(directory) / name
+                assets[Path("images") / source.relative_to(config.images)] = source
+    return assets
+
+
+def is_current(source: Path, dest: Path):
+    """Like rsync, trust size and (whole-second) modification time"""
+    if not dest.is_file():
+        return False
+    src, dst = source.stat(), dest.stat()
+    return src.st_size == dst.st_size and int(src.st_mtime) == int(dst.st_mtime)
+
+
+@profiling.profiled("copy")
+def sync_tree(target_dir: Path, assets):
+    """
+    Make target_dir hold exactly 'assets' ({relative path: source path}),
+    like rsync --delete: anything else is removed, and only files that
+    differ are copied. They're copies rather than links, so nothing done
+    in target_dir can change the sources. Returns the number of files copied.
+    """
+    target_dir.mkdir(parents=True, exist_ok=True)
+    for path in sorted(target_dir.rglob("*"), reverse=True):  # Contents first
+        if path.is_dir() and not path.is_symlink():
+            if not any(path.iterdir()):
+                path.rmdir()
+        elif path.relative_to(target_dir) not in assets:
+            path.unlink()
+    copied = 0
+    for relative, source in sorted(assets.items()):
+        dest = target_dir / relative
+        if is_current(source, dest):
+            continue
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        if dest.is_symlink():
+            dest.unlink()
+        shutil.copy2(str(source), str(dest))  # Keeps the mtime, for is_current()
+        copied += 1
+    return copied
+
+
+def asset_names(ebook_type: BookType = BookType.EPUB):
+    """
+    Top-level names of the ebook_assets(), for retain_files() to leave in
+    place so the next build only copies what changed
+    """
+    return {relative.parts[0] for relative in ebook_assets(ebook_type)}
+
+
+def regenerate_ebook_build_dir(ebook_build_dir, ebook_type: BookType = BookType.EPUB):
+    """
+    Bring ebook_build_dir back to its starting assets, removing everything
+    else, but without recopying assets that haven't changed
+    """
+    sync_tree(ebook_build_dir, ebook_assets(ebook_type))
 
 
 def strip_chapter(chapter_text):
@@ -136,26 +193,140 @@ def strip_chapter(chapter_text):
     return stripped.strip()  # In case the previous line adds another newline
 
 
-def strip_review_notes(target: Path):
-    lines = target.read_text().strip().splitlines()
-    review = [x for x in lines if x.startswith("+ [")]
-    mistakes = [
-        x for x in review if not "Ready for Review" in x and not "Tech Checked" in x]
+########################### Assembly pipeline ############################
+# Markdown is assembled by chaining generators, so each atom is read,
+# filtered and written in one linear pass without holding the whole book.
+
+
+def atom_paths():
+    return sorted(config.markdown_dir.glob("*.md"))
+
+
+def read_atoms(paths):
+    for md in paths:
+        yield md.read_text(encoding="utf-8")
+
+
+def separated(texts):
+    """Each atom followed by a blank line"""
+    for text in texts:
+        yield text + "\n\n"
+
+
+def sample_only(texts, full_atoms):
+    """
+    The first full_atoms atoms, then only the title of each of the rest
+    """
+    for n, text in enumerate(texts):
+        content = text.strip()
+        if n < full_atoms:
+            yield content + "\n\n"
+        else:
+            yield ("\n".join(content.splitlines()[:3])).strip() + "\n\n"
+            yield "(Not included in sample)\n\n"
+
+
+def lines_of(chunks):
+    """Chunks must end with a newline (except the last)"""
+    for chunk in chunks:
+        yield from chunk.splitlines()
+
+
+def trim_blank_lines(lines):
+    """Drop leading and trailing blank lines, as str.strip() would"""
+    started = False
+    blanks = []
+    for line in lines:
+        if not line.strip():
+            if started:
+                blanks.append(line)
+            continue
+        if not started:
+            line = line.lstrip()
+            started = True
+        yield from blanks
+        blanks = []
+        yield line
+
+
+def drop_review_marks(lines):
+    """Remove '+ [' status lines, which must all be review/tech-check marks"""
+    mistakes = []
+    for line in lines:
+        if line.startswith("+ ["):
+            if not "Ready for Review" in line and not "Tech Checked" in line:
+                mistakes.append(line)
+            continue
+        yield line.rstrip()
     assert not mistakes, mistakes
-    result = [x.rstrip() for x in lines if not x.startswith("+ [")]
-    result2 = ""
+
+
+def drop_notes(lines):
+    """Remove '+ Notes:' blocks, up to the next blank line"""
     in_notes = False
-    for line in result:
+    for line in lines:
         if line.startswith("+ Notes:"):
             in_notes = True
         if in_notes and len(line) == 0:
             in_notes = False
         if not in_notes:
-            result2 += line + "\n"
-    result3 = re.sub("{{.*?}}", "", result2, flags=re.DOTALL)
-    target.write_text(result3 + "\n")
+            yield line + "\n"
+
+
+def drop_tags(pieces):
+    """Remove {{ tags }}, which may span lines; an unclosed {{ is kept"""
+    unclosed = None
+    for piece in pieces:
+        kept = []
+        pos = 0
+        while True:
+            if unclosed is None:
+                start = piece.find("{{", pos)
+                if start < 0:
+                    kept.append(piece[pos:])
+                    break
+                kept.append(piece[pos:start])
+                unclosed = ["{{"]
+                pos = start + 2
+            else:
+                end = piece.find("}}", pos)
+                if end < 0:
+                    unclosed.append(piece[pos:])
+                    break
+                unclosed = None
+                pos = end + 2
+        if kept:
+            yield "".join(kept)
+    if unclosed is not None:
+        yield "".join(unclosed)
+
+
+def without_notes(chunks):
+    """Stage that removes review marks, notes and {{ tags }}"""
+    yield from drop_tags(drop_notes(drop_review_marks(trim_blank_lines(lines_of(chunks)))))
+    yield "\n"
+
+
+def assemble(target: Path, pieces):
+    """Stream pieces into target, replacing it only once they're all written"""
+    if not target.parent.exists():
+        os.makedirs(target.parent)
+    temp = target.with_name(target.name + ".tmp")
+    try:
+        with temp.open('w', encoding="utf-8") as assembled:
+            for piece in pieces:
+                assembled.write(piece)
+        os.replace(str(temp), str(target))
+    finally:
+        if temp.exists():
+            temp.unlink()
+
+
+def strip_review_notes(target: Path):
+    assemble(target, without_notes([target.read_text(encoding="utf-8")]))
 
 
+@profiling.profiled("copy")
 def copy_markdown_files(target_dir, strip_notes=False):
     """
     Copy markdown files to target directory
@@ -176,44 +347,24 @@ def copy_markdown_files(target_dir, strip_notes=False):
     return "\n".join([copy(file) for file in sorted(list(config.markdown_dir.glob("*.md")))])
 
 
+@profiling.profiled("copy")
 def combine_markdown_files(target, strip_notes=False):
     """
     Put markdown files together and place result in target directory
     """
-    if not target.parent.exists():
-        os.makedirs(target.parent)
-    files = sorted(list(config.markdown_dir.glob("*.md")))
-    with open(target, 'w') as assembled:
-        for f in files:
-            assembled.write(f.read_text() + "\n\n")
+    pieces = separated(read_atoms(atom_paths()))
     if strip_notes:
-        strip_review_notes(target)
+        pieces = without_notes(pieces)
+    assemble(target, pieces)
     return f"{target.name} Created"
 
 
+@profiling.profiled("copy")
 def combine_sample_markdown(target):
     """
     Build markdown file for free sample
     """
-    def extract(md, title_only=False):
-        with md.open(encoding="utf8") as chapter:
-            content = chapter.read().strip()
-            if title_only:
-                return ("\n".join(content.splitlines()[:3])).strip() + "\n\n"
-            return content + "\n\n"
-
-    if not target.parent.exists():
-        os.makedirs(target.parent)
-    assembled = ""
-    atoms = [md for md in config.markdown_dir.glob("*.md")]
-    for content in atoms[:config.sample_size + 1]:
-        assembled += extract(content)
-    for title_only in atoms[config.sample_size + 1:]:
-        assembled += extract(title_only, True)
-        assembled += "(Not included in sample)\n\n"
-    with target.open('w', encoding="utf8") as book:
-        book.write(assembled)
-    strip_review_notes(target)
+    assemble(target, without_notes(sample_only(read_atoms(atom_paths()), config.sample_size + 1)))
     return f"{target.name} Created"
 
 
@@ -1,15 +1,33 @@
 """
 Validation test framework and checks
 """
+import bisect
+import contextlib
+import fnmatch
+import inspect
+import io
 import os
 import pprint
 import re
+import subprocess
 import sys
 import textwrap
 from abc import ABC, abstractmethod
+from itertools import groupby, repeat
 from pathlib import Path
 import book_builder.config as config
+import book_builder.data_files as data_files
+import book_builder.findings as findings
+import book_builder.markdown_tokens as tokens
+import book_builder.profiling as profiling
+from book_builder.corpus import Corpus, text_of
+from book_builder.exclusions import ExclusionStore, any_atom
+from book_builder.line_scanner import LineScanner, lines_of
+from book_builder.spelling import Dictionary
+from book_builder.project_index import ProjectIndex
+from book_builder.symbols import without_comments
 from book_builder.util import create_markdown_filename
+from book_builder.validation_cache import ValidationCache, digest
 
 
 class Editor:
@@ -34,6 +52,27 @@ class Editor:
 
 editor = Editor()  # Global Editor for working with the results
 
+# While a validator runs, appends to data files are recorded here instead of
+# written, so they can be cached and replayed in the same order as a serial run.
+deferred_appends = None
+deferred_exclusions = None
+# Appends waiting for flush_data_files(), in order, for each data file:
+pending_appends = {}
+
+
+def append_to_data_file(path, text):
+    if deferred_appends is not None:
+        deferred_appends.append((path, text))
+        return
+    pending_appends.setdefault(str(path), []).append(text)
+
+
+def flush_data_files():
+    """Write the pending appends, as one batch for each data file"""
+    for path, texts in sorted(pending_appends.items()):
+        data_files.append(Path(path), "".join(texts))
+    pending_appends.clear()
+
 
 class MarkdownFile:
     """
@@ -45,29 +84,82 @@ class MarkdownFile:
     def __init__(self, md_path, trace=False):
         self.path = md_path
         self.trace_flag = trace
-        self.text: str = md_path.read_text(encoding="UTF-8")
-        self.lines = self.text.splitlines()
+        self.text: str = text_of(md_path)
+        self.lines = lines_of(self.text)
+        # Offset of the start of each line, for line_of():
+        self.line_starts = [0] + [m.end() for m in re.finditer("\n", self.text)]
         self.title = self.lines[0]
         self.titled = False
         self.err_msg = ""
         self.line_number = None
-        self.listings = [CodeListing(marker, code, self) for (marker, code) in
-                         re.findall("(```.*?)\n(.*?)\n```", self.text, flags=re.DOTALL)]
-        # With listings removed:
-        self.prose = re.sub(
-            "```(.*?)\n(.*?)\n```", "", self.text, flags=re.DOTALL)
+        self.errors = []  # (msg, line_number, column) for each call to error()
+        self.excluded = []  # Items that were found, but excluded
+        # Parsed on first use, so atoms with cached results aren't parsed:
+        self._listings = None
+        self._prose = None
+        self._prose_lines = None
+        self._matches = None
+
+    @property
+    def listings(self):
+        if self._listings is None:
+            self._listings = [CodeListing(span, self) for span in tokens.listings(self.text)]
+        return self._listings
+
+    @property
+    def prose(self):
+        """With listings removed"""
+        if self._prose is None:
+            self._prose = tokens.without_listings(self.text)
+        return self._prose
+
+    @property
+    def prose_lines(self):
+        """
+        (line_number, line) for each line of prose, where line_number is
+        the line in the atom. Each listing leaves an empty line behind.
+        """
+        if self._prose_lines is None:
+            self._prose_lines = []
+            listing_lines = {}
+            for listing in self.listings:
+                # Closing line, from the span; counting the code's lines misses trailing blanks:
+                listing_lines[listing.span.line] = self.line_of(listing.span.end - 1)
+            n = 0
+            while n < len(self.lines):
+                if n in listing_lines:
+                    n = listing_lines[n]  # Closing line
+                    self._prose_lines.append((n, self.lines[n][3:]))
+                else:
+                    self._prose_lines.append((n, self.lines[n]))
+                n += 1
+        return self._prose_lines
+
+    def matches(self, kind):
+        """
+        Matches of kind in the whole atom, as found by line_scanner(). The
+        atom is scanned once for all the validators that use it.
+        """
+        if self._matches is None:
+            self._matches = line_scanner().scan(self.text)
+        return [match for match in self._matches if match.kind == kind]
+
+    def line_of(self, offset):
+        """Line number containing the character at offset in text"""
+        return bisect.bisect_right(self.line_starts, offset) - 1
 
     def trace(self, msg):
         if self.trace_flag:
             print(msg)
 
-    def error(self, msg, line_number=None):
+    def error(self, msg, line_number=None, column=None):
+        self.errors.append((msg, line_number, column))
         # Add title for the first error only:
         if not self.titled:
             self.err_msg += self.path.name + "\n"
             self.titled = True
         self.err_msg += f"    {msg}\n"
-        if line_number:
+        if line_number is not None:
             self.line_number = line_number
         return self.err_msg
 
@@ -79,9 +171,21 @@ class MarkdownFile:
         if self.err_msg:
             self.trace(f"Editing {self}")
             editor.markdown_files.append(
-                f"{self.path}:{self.line_number + 1}" if self.line_number else f"{self.path}"
+                f"{self.path}:{self.line_number + 1}" if self.line_number is not None
+                else f"{self.path}"
             )
 
+    def __getstate__(self):
+        """
+        Only the error report is sent back from a worker process;
+        the parent doesn't need the parsed contents.
+        """
+        state = self.__dict__.copy()
+        for parsed in ("text", "lines", "line_starts", "_listings", "_prose", "_prose_lines",
+                       "_matches"):
+            del state[parsed]
+        return state
+
     def __str__(self):
         return self.path.name
 
@@ -91,38 +195,24 @@ class CodeListing:
     Holds all information about a single code listing in a Markdown file.
     """
 
-    is_slugline = re.compile(f"^// .+?\.[a-z]+$", re.MULTILINE)
-
-    strip_comments = re.compile(
-        r'//.*?$|/\*.*?\*/|\'(?:\\.|[^\\\'])*\'|"(?:\\.|[^\\"])*"',
-        re.DOTALL | re.MULTILINE)
-
     package_name = re.compile(r'^package (\S*).*$', flags=re.MULTILINE)
 
     @staticmethod
     def comment_remover(text):
-        def replacer(match):
-            s = match.group(0)
-            if s.startswith('/'):
-                return " "  # note: a space and not an empty string
-            else:
-                return s
-
-        return re.sub(CodeListing.strip_comments, replacer, text)
+        return without_comments(text)
 
-    def __init__(self, marker, code, md: MarkdownFile):
+    def __init__(self, span: tokens.Span, md: MarkdownFile):
         self.md = md
-        self.marker = marker
-        self.code = code
-        self.lines = code.splitlines()
+        self.span = span
+        self.marker = span.marker
+        self.code = span.code
+        self.lines = lines_of(self.code)
         self.slug = self.lines[0]
-        self.proper_slugline = CodeListing.is_slugline.match(self.slug)
-        if self.proper_slugline:
-            self.directory = self.slug[3:].split('/')[0]
-        else:
-            self.directory = None
-        self.md_starting_line = self.md.lines.index(self.slug)
-        self.no_comments = CodeListing.comment_remover(code)
+        path = tokens.slug_path(self.slug, ["//"])
+        self.proper_slugline = path is not None
+        self.directory = path.split('/')[0] if path else None
+        self.md_starting_line = span.line + 1
+        self.no_comments = CodeListing.comment_remover(self.code)
         self.package = ""
         package = CodeListing.package_name.findall(self.code)
         if package:
@@ -132,9 +222,133 @@ class CodeListing:
         return f"{self.marker}:\n{self.code}"
 
 
+def run_validator(validator, md: MarkdownFile):
+    """
+    Run a validator on md. The errors are added to md as usual; everything
+    else the validator produces is captured and returned as a result that
+    can be cached and later replayed with apply_result().
+    """
+    global deferred_appends, deferred_exclusions
+    first_error = len(md.errors)
+    first_excluded = len(md.excluded)
+    deferred_appends = []
+    deferred_exclusions = []
+    saved_data_files, editor.data_files = editor.data_files, set()
+    output = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(output):
+            validator.validate(md)
+        return {
+            "output": output.getvalue(),
+            "errors": md.errors[first_error:],
+            "excluded": md.excluded[first_excluded:],
+            "appends": [(str(path), text) for path, text in deferred_appends],
+            "exclusions": deferred_exclusions,
+            "data_files": sorted(editor.data_files),
+        }
+    finally:
+        deferred_appends = None
+        deferred_exclusions = None
+        editor.data_files = saved_data_files
+
+
+def apply_result(result):
+    """Display the output and write the data-file appends from a result"""
+    print(result["output"], end="")
+    for path, text in result["appends"]:
+        append_to_data_file(path, text)
+    for section, atom_name, item in result["exclusions"]:
+        exclusion_store.add(section, atom_name, item)
+    editor.data_files.update(result["data_files"])
+
+
+# The cache used within a worker process, set by the pool initializer:
+worker_cache = None
+
+
+def findings_of(validator, atom_name, result):
+    """Findings from a validator's result, with one-based lines and columns"""
+    def one_based(n):
+        return n + 1 if n is not None else None
+
+    return [findings.Finding(validator.name(), atom_name, one_based(line_number),
+                             one_based(column), validator.severity, msg, False)
+            for msg, line_number, column in result["errors"]] + \
+           [findings.Finding(validator.name(), atom_name, None, None, validator.severity,
+                             item, True)
+            for item in result["excluded"]]
+
+
+def init_worker(cache_entries):
+    global worker_cache
+    worker_cache = ValidationCache(cache_entries) if cache_entries is not None else None
+
+
+def check_file_in_worker(md_path, validators, trace):
+    """Validate one Markdown file in a worker process"""
+    return Validator.check_file(md_path, validators, trace, worker_cache)
+
+
+def project_index():
+    """The cached ProjectIndex that the book-wide indexes are built from"""
+    global _project_index
+    if _project_index is None:
+        _project_index = ProjectIndex()
+    return _project_index
+
+
+_project_index = None
+
+
+def changed_atoms(ref=None, staged=False):
+    """
+    Paths of the numbered atoms changed since ref (including new ones not
+    yet added to git), or just those staged for commit, from git diff.
+    """
+    md_dir = config.markdown_dir
+
+    def git(*args):
+        result = profiling.run(["git"] + list(args), cwd=str(md_dir), stdout=subprocess.PIPE,
+                               stderr=subprocess.PIPE, universal_newlines=True)
+        if result.returncode != 0:
+            sys.exit(f"git {' '.join(args)} failed:\n{result.stderr}")
+        return result.stdout.splitlines()
+
+    if staged:
+        names = git("diff", "--name-only", "--relative", "--cached", "--", ".")
+    else:
+        names = (git("diff", "--name-only", "--relative", ref, "--", ".")
+                 + git("ls-files", "--others", "--exclude-standard", "--", "."))
+    return sorted({md_dir / name for name in names
+                   if fnmatch.fnmatch(name, "[0-9]*_*.md") and (md_dir / name).exists()})
+
+
+class lazy:
+    """
+    A class attribute that isn't created until it's first used, such as an
+    index of the whole book. Assigning to the attribute replaces it.
+    """
+
+    def __init__(self, create):
+        self.create = create
+        self.name = None
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, instance, owner):
+        value = self.create()
+        setattr(owner, self.name, value)
+        return value
+
+
 class Validator(ABC):
     """Abstract base class for all validators"""
 
+    jobs = 1  # Worker processes for all_checks() and one_check(); 0 uses all cores
+    use_cache = True  # Skip atoms whose validation inputs haven't changed
+    severity = "error"
+
     def __init__(self, trace):
         self.trace = trace
 
@@ -146,53 +360,167 @@ class Validator(ABC):
     def post_process(self):
         """
         (Optional) Run once, at the end of all_checks().
-        Performs any desired 'group actions'.
+        Performs any desired 'group actions'. Returns any Findings, for
+        the reports.
         """
-        pass
+        return []
 
     def name(self):
         return f"{self.__class__.__name__}"
 
+    def global_inputs(self):
+        """
+        (Optional) Anything outside the atom that this validator's
+        per-atom results depend on, for the validation cache.
+        """
+        return ""
+
+    def cache_key(self, md: MarkdownFile):
+        """Hash of everything that this validator's result for md depends on"""
+        data_digests = [d.digest for d in vars(type(self)).values()
+                      if isinstance(d, (Data, Dictionary, Exclusions))]
+        return digest(engine_digest, self.name(), self.trace, md.path.name, md.text,
+                      *data_digests, self.global_inputs())
+
+    @staticmethod
+    def check_file(md_path, validators, trace, cache=None):
+        """
+        Run validators on a single Markdown file, replaying cached results
+        where they're still valid. Returns the MarkdownFile along with
+        (validator name, cache key, result, hit) for each validator.
+        """
+        with profiling.timed("markdown", "parse", atom=md_path.name):
+            markdown_file = MarkdownFile(md_path, trace)
+        runs = []
+        for val in validators:
+            key = val.cache_key(markdown_file) if cache else None
+            result = cache.lookup(md_path.name, val.name(), key) if cache else None
+            if result is not None:
+                for msg, line_number, column in result["errors"]:
+                    markdown_file.error(msg, line_number, column)
+                markdown_file.excluded += result["excluded"]
+                runs.append((val.name(), key, result, True))
+            else:
+                with profiling.timed("validator", val.name(), atom=md_path.name):
+                    result = run_validator(val, markdown_file)
+                runs.append((val.name(), key, result, False))
+        return markdown_file, runs
+
+    @staticmethod
+    def check_files(validators, trace, md_paths=None, post_process=True, reports=None):
+        """
+        Run validators on every atom (or just md_paths), in sorted order.
+        With more than one job, atoms are sharded across a process pool and
+        the results are reported in the same order as a serial run. reports
+        is {format: path} to write the findings to, as in findings.formats.
+        """
+        all_paths = [config.markdown_dir / name
+                     for name in Corpus.of().file_names("[0-9]*_*.md")]
+        md_paths = all_paths if md_paths is None else sorted(md_paths)
+        cache = ValidationCache.load() if Validator.use_cache else None
+        for val in validators:
+            # Here rather than in a worker, so anything imported is saved:
+            for exclusions in vars(type(val)).values():
+                if isinstance(exclusions, Exclusions):
+                    exclusions.load()
+        jobs = Validator.jobs or os.cpu_count()
+        skipped = 0
+        rules = {val.name(): inspect.cleandoc(val.__doc__).splitlines()[0] for val in validators}
+        with contextlib.ExitStack() as stack:
+            if jobs == 1 or len(md_paths) < 2:
+                results = (Validator.check_file(md_path, validators, trace, cache)
+                           for md_path in md_paths)
+            else:
+                from concurrent.futures import ProcessPoolExecutor  # Slow to import
+                for val in validators:
+                    val.global_inputs()  # Build book-wide indexes once, before forking
+                chunksize = max(1, len(md_paths) // (jobs * 4))
+                pool = stack.enter_context(ProcessPoolExecutor(
+                    max_workers=jobs, initializer=init_worker,
+                    initargs=(cache.entries if cache else None,)))
+                # Each atom's results are reported as they arrive, still in order:
+                results = profiling.collected(pool.map(
+                    profiling.worker_call, repeat(profiling.enabled), repeat(check_file_in_worker),
+                    md_paths, repeat(validators), repeat(trace), chunksize=chunksize))
+            writers = stack.enter_context(
+                findings.writers(reports or {}, rules, config.markdown_dir))
+            for markdown_file, runs in results:
+                atom_name = markdown_file.path.name
+                for val, (validator_name, key, result, hit) in zip(validators, runs):
+                    apply_result(result)
+                    if cache and not hit:
+                        cache.store(atom_name, validator_name, key, result)
+                    for writer in writers:
+                        writer.check(validator_name, atom_name,
+                                     findings_of(val, atom_name, result))
+                if runs and all(hit for _, _, _, hit in runs):
+                    skipped += 1
+                markdown_file.show()
+                markdown_file.edit()
+
+            if post_process:
+                for val in validators:
+                    if type(val).post_process is Validator.post_process:
+                        continue  # Nothing to do
+                    with profiling.timed("validator", f"{val.name()}.post_process"):
+                        found = val.post_process()
+                    by_atom = {}
+                    for finding in found:
+                        by_atom.setdefault(finding.atom, []).append(finding)
+                    for atom_name, atom_findings in sorted(by_atom.items()):
+                        for writer in writers:
+                            writer.check(f"{val.name()}.post_process", atom_name, atom_findings)
+        flush_data_files()
+        exclusion_store.save()
+        if cache:
+            cache.save({md_path.name for md_path in all_paths})
+            if skipped:
+                print(f"({skipped} unchanged atoms replayed from cache)")
+
     @staticmethod
-    def all_checks(trace):
-        """Run all tests to find problems in the book"""
+    def changed_only(changed):
+        """
+        The atoms to validate: changed (as from changed_atoms()), or None
+        for all of them
+        """
+        if changed is not None:
+            print(f"Changed atoms: {', '.join(path.name for path in changed) or 'none'}")
+        return changed
+
+    @staticmethod
+    @profiling.profiled("target", "validate all")
+    def all_checks(trace, changed=None, reports=None):
+        """
+        Run all tests to find problems in the book, or just in the changed
+        atoms. reports is as for check_files().
+        """
         md_dir = config.markdown_dir
         print(f"Validating {md_dir}")
         assert md_dir.exists(), f"Cannot find {md_dir}"
         # Create an object for each Validator:
         validators = [v(trace) for v in Validator.__subclasses__()]
-        for md_path in md_dir.glob("[0-9]*_*.md"):
-            markdown_file = MarkdownFile(md_path, trace)
-            for val in validators:
-                val.validate(markdown_file)
-            markdown_file.show()
-            markdown_file.edit()
-
-        for val in validators:
-            val.post_process()
-
+        Validator.check_files(validators, trace, Validator.changed_only(changed),
+                              reports=reports)
         editor.open()
 
     @staticmethod
-    def one_check(validator, trace):
-        """Run a single Validator"""
+    @profiling.profiled("target", "validate one")
+    def one_check(validator, trace, changed=None, reports=None):
+        """Run a single Validator, as for all_checks()"""
         md_dir = config.markdown_dir
         vdtor = validator(trace)
         print(f"Running {vdtor.command_name} on {md_dir}")
         assert md_dir.exists(), f"Cannot find {md_dir}"
-        # Create an object for each Validator:
-        for md_path in md_dir.glob("[0-9]*_*.md"):
-            markdown_file = MarkdownFile(md_path, trace)
-            vdtor.validate(markdown_file)
-            markdown_file.show()
-            markdown_file.edit()
-
-        vdtor.post_process()
+        Validator.check_files([vdtor], trace, Validator.changed_only(changed),
+                              reports=reports)
         editor.open()
 
 
 class Data:
-    """Maintains a data file for a particular validate function"""
+    """
+    Maintains a data file for a particular validate function.
+    The file isn't read until a validator first uses it.
+    """
     names = {}
 
     def __init__(self, data_file_name, storage_dir=config.data_path):
@@ -201,37 +529,174 @@ class Data:
             Data.names[data_file_name] = "False"
         self.needs_edit = False
         self.ef_path = storage_dir / data_file_name
+        self._data = None
+        self._digest = None
+        self._set = None
+
+    def forget(self):
+        """Read the file again on next use"""
+        self._data = None
+        self._digest = None
+        self._set = None
+
+    def _load(self):
         if not self.ef_path.exists():
-            self.ef_path.write_text("")
-        self.data = self.ef_path.read_text()
-        if config.msgbreak in self.data and not Data.names[data_file_name]:
-            Data.names[data_file_name] = True
+            self.ef_path.write_text("", encoding="utf-8")
+        self._data = self.ef_path.read_text(encoding="utf-8")
+        self._digest = digest(self._data)
+        if config.msgbreak in self._data and not Data.names[self.ef_path.name]:
+            Data.names[self.ef_path.name] = True
             print(f"{self.ef_path.name} Needs Editing!")
-        self.set = {line.strip() for line in self.data.splitlines()}
+        self._set = {line.strip() for line in self._data.splitlines()}
+
+    @property
+    def data(self):
+        if self._data is None:
+            self._load()
+        return self._data
+
+    @property
+    def digest(self):
+        if self._data is None:
+            self._load()
+        return self._digest
+
+    @property
+    def set(self):
+        if self._data is None:
+            self._load()
+        return self._set
 
     def error(self, msg, md: MarkdownFile):
         """Add message to exclusion file and edit that file"""
-        with open(self.ef_path, "a") as ef:
-            ef.write(f"{md.path.name}:\n")
-            ef.write(f"    {msg}\n")
-            ef.write(config.msgbreak + "\n")
+        append_to_data_file(
+            self.ef_path, f"{md.path.name}:\n    {msg}\n{config.msgbreak}\n")
         editor.data_files.add(f"{self.ef_path}")
 
     def __contains__(self, item):
-        return item in self.data
+        return item.strip() in self.set
 
     def __iter__(self):
         return self.data.splitlines().__iter__()
 
 
-class Exclusions(Data):
+exclusion_store = ExclusionStore(config.data_path / "exclusions" / "exclusions.json",
+                                 config.msgbreak)
+
+
+def forget_data_files():
+    """
+    Drop everything read from the data and exclusion files, and what was
+    built from them, so it's all read again on next use ('bb serve' calls
+    this when they change).
+    """
+    global exclusion_store, _line_scanner, _project_index
+    for validator in Validator.__subclasses__():
+        for data in vars(validator).values():
+            if isinstance(data, Data):
+                data.forget()
+    exclusion_store = ExclusionStore(exclusion_store.path, exclusion_store.msgbreak)
+    _line_scanner = None
+    _project_index = None
+
+
+class Exclusions:
+    """
+    A validator's section of the exclusion store, named after the validator
+    (and the attribute, if it isn't 'exclude'). legacy_file_name is the old
+    exclusion text file, imported into the store the first time it's used.
+    With book_wide, exclusions apply to every atom rather than just the one
+    they were found in.
+    """
+
+    def __init__(self, legacy_file_name, book_wide=False):
+        self.legacy_path = config.data_path / "exclusions" / legacy_file_name
+        self.book_wide = book_wide
+        self.section = legacy_file_name
+
+    def __set_name__(self, owner, name):
+        self.section = owner.__name__ if name == "exclude" else f"{owner.__name__}.{name}"
+
+    @property
+    def ef_path(self):
+        return exclusion_store.path
+
+    @property
+    def digest(self):
+        return exclusion_store.digest(self.section, self.legacy_path)
+
+    def load(self):
+        """Read the section now (importing the old file), rather than on first use"""
+        exclusion_store.section(self.section, self.legacy_path)
+
+    def excludes(self, item, md: MarkdownFile):
+        """Whether item (ignoring differences in whitespace) is excluded in md"""
+        if exclusion_store.contains(self.section, md.path.name, item, self.legacy_path):
+            md.excluded.append(str(item))
+            return True
+        return False
+
+    def error(self, item, md: MarkdownFile):
+        """
+        Exclude item from now on, and edit the store. Pass the same item
+        that excludes() checks, not the error message.
+        """
+        exclusion = (self.section, any_atom if self.book_wide else md.path.name, str(item))
+        if deferred_exclusions is not None:
+            deferred_exclusions.append(exclusion)
+        else:
+            exclusion_store.add(*exclusion)
+        editor.data_files.add(f"{exclusion_store.path}")
+
+
+def engine_modules():
+    """
+    This module and every book_builder module it uses, directly or through
+    another one, sorted by name. Found from what's imported rather than
+    listed, so a new dependency can't be left out.
+    """
+    found = set()
+    pending = [__name__]
+    while pending:
+        name = pending.pop()
+        if name in found:
+            continue
+        found.add(name)
+        for value in vars(sys.modules[name]).values():
+            if inspect.ismodule(value):
+                module = value.__name__
+            else:
+                module = getattr(value, "__module__", None)  # Where a function or class is from
+            if (isinstance(module, str) and module.startswith("book_builder.")
+                    and module in sys.modules):
+                pending.append(module)
+    return [sys.modules[name] for name in sorted(found)]
+
+
+# Cached results become invalid when the validators, the modules they use or
+# their settings change:
+engine_digest = digest(
+    *[Path(module.__file__).read_text(encoding="UTF-8") for module in engine_modules()],
+    config.language_name, config.code_width, config.start_comment, config.exercise_header,
+    config.msgbreak)
+
+
+def line_scanner():
     """
-    Maintains an exclusion file for a particular validate function.
-    Places files in the "exclusions" subdirectory.
+    Scanner for everything that NoTabs, Characters and HotWords look for,
+    built on first use (a 'bb serve' reload of this module rebuilds it).
     """
+    global _line_scanner
+    if _line_scanner is None:
+        _line_scanner = LineScanner({
+            "tab": ["\t"],
+            "bad_char": Characters.bad_chars,
+            "hotword": HotWords.words.set,
+        })
+    return _line_scanner
 
-    def __init__(self, exclusion_file_name):
-        super().__init__(exclusion_file_name, config.data_path / "exclusions")
+
+_line_scanner = None
 
 
 ### Validators ###
@@ -252,11 +717,13 @@ class ExerciseForEDU(Validator):
                 return
         if md.title == "Introduction":
             return
-        if "\n" + config.exercise_header not in md.text:
+        exercise_blocks = tokens.spans_of(tokens.EXERCISES, md.text)
+        if not exercise_blocks:
             print(f"No exercise block in {md.title}")
             return
-        exercise_block = md.text.split("\n" + config.exercise_header)[1]
-        solutions = re.findall("```kotlin\n(.*?)\n```", exercise_block, flags=re.DOTALL)
+        solutions = [listing.code for listing in tokens.listings(md.text)
+                     if listing.start > exercise_blocks[0].start
+                     and listing.marker == "```kotlin"]
         if solutions:
             for solution in solutions:
                 first_line = solution.splitlines()[0]
@@ -277,9 +744,9 @@ class NoTabs(Validator):
     command_name = "tabs"
 
     def validate(self, md: MarkdownFile):
-        for n, line in enumerate(md.lines):
-            if "\t" in line:
-                md.error("Tab found!", n)
+        for n, tabs in groupby(md.matches("tab"), lambda match: match.line):
+            column = next(tabs).column
+            md.error(f"Tab found! (column {column})", n, column)
 
 
 class Characters(Validator):
@@ -289,9 +756,10 @@ class Characters(Validator):
     bad_chars = ['’']
 
     def validate(self, md: MarkdownFile):
-        for n, line in enumerate(md.lines):
-            if any([bad_char in line for bad_char in Characters.bad_chars]):
-                md.error(f"line {n} contains bad character:\n{line}", n)
+        for n, bad in groupby(md.matches("bad_char"), lambda match: match.line):
+            bad = list(bad)
+            found = ", ".join(f"{match.text} (column {match.column})" for match in bad)
+            md.error(f"line {n} contains bad character {found}:\n{md.lines[n]}", n, bad[0].column)
 
 
 class TagNoGap(Validator):
@@ -315,12 +783,12 @@ class FilenamesAndTitles(Validator):
             return
         atom_title = md.title[2:].split("{")[0].strip()
         if create_markdown_filename(atom_title) != md.path.name[4:]:
-            md.error(f"Atom Title Line: {md.title}")
-            md.error(f"atom_title: {atom_title}")
-            md.error(f"create_markdown_filename: {create_markdown_filename(atom_title)}")
-            md.error(f"md.path.name: {md.path.name[4:]}")
+            md.error(f"Atom Title Line: {md.title}", 0)
+            md.error(f"atom_title: {atom_title}", 0)
+            md.error(f"create_markdown_filename: {create_markdown_filename(atom_title)}", 0)
+            md.error(f"md.path.name: {md.path.name[4:]}", 0)
         if " and " in atom_title:
-            md.error(f"'and' in title should be '&': {atom_title}")
+            md.error(f"'and' in title should be '&': {atom_title}", 0)
 
 
 class PackageNames(Validator):
@@ -336,17 +804,20 @@ class PackageNames(Validator):
 
 class HotWords(Validator):
     """Words that might need rewriting"""
+    severity = "warning"
     exclude = Exclusions("hotwords_sentences.txt")
     words = Data("hotwords_to_find.txt")
     command_name = "hotwords"
 
     def validate(self, md: MarkdownFile):
-        for n, line in enumerate(md.lines):
-            hw = [
-                w for w in HotWords.words.set if w in line and not line in HotWords.exclude]
-            if hw:
-                md.error(f"Hot word: {hw}\n{line}", n)
-                HotWords.exclude.error(f"Hot word [{n}]: {hw}\n{line}", md)
+        for n, found in groupby(md.matches("hotword"), lambda match: match.line):
+            line = md.lines[n]
+            if HotWords.exclude.excludes(line, md):
+                continue
+            found = list(found)
+            hw = [f"{match.text} (column {match.column})" for match in found]
+            md.error(f"Hot word: {hw}\n{line}", n, found[0].column)
+            HotWords.exclude.error(line, md)
 
 
 class CodeListingLineWidths(Validator):
@@ -374,12 +845,13 @@ class ExampleSluglines(Validator):
                 continue  # Improper code fragments caught elsewhere
             if not listing.slug.startswith(config.start_comment + " "):
                 md.error(
-                    f"Bad first line (no space after beginning of comment):\n\t{listing.slug}")
+                    f"Bad first line (no space after beginning of comment):\n\t{listing.slug}",
+                    listing.md_starting_line)
                 continue
             slug = listing.slug.split(None, 1)[1]
-            if "/" not in slug and slug not in ExampleSluglines.exclude:
-                ExampleSluglines.exclude.error(
-                    md.error(f"Missing directory in:\n{slug}"), md)
+            if "/" not in slug and not ExampleSluglines.exclude.excludes(slug, md):
+                md.error(f"Missing directory in:\n{slug}", listing.md_starting_line)
+                ExampleSluglines.exclude.error(slug, md)
 
 
 class CompleteExamples(Validator):
@@ -392,7 +864,7 @@ class CompleteExamples(Validator):
         for listing in md.listings:
             if listing.proper_slugline:
                 continue
-            if listing.slug in CompleteExamples.exclude:
+            if CompleteExamples.exclude.excludes(listing.slug, md):
                 continue
             for line in listing.lines:
                 if line.strip().startswith("fun "):
@@ -402,28 +874,26 @@ class CompleteExamples(Validator):
     def validate(self, md: MarkdownFile):
         noslug = CompleteExamples.examples_without_sluglines(md)
         if noslug:
-            CompleteExamples.exclude.error(md.error(
-                f"Contains compileable example(s) without a slugline:\n{noslug.slug}",
-                noslug.md_starting_line), md)
+            md.error(f"Contains compileable example(s) without a slugline:\n{noslug.slug}",
+                     noslug.md_starting_line)
+            CompleteExamples.exclude.error(noslug.slug, md)
 
 
 class SpellCheck(Validator):
     """Spell-check everything"""
     command_name = "spelling"
 
-    main_dictionary = Data("dictionary.txt")
     supplemental = Data("supplemental_dictionary.txt")
-    dictionary = main_dictionary.set.union(supplemental.set)
+    dictionary = Dictionary("dictionary.txt", "supplemental_dictionary.txt")
 
     def validate(self, md: MarkdownFile):
-        words = set(
-            re.split("(?:(?:[^a-zA-Z]+')|(?:'[^a-zA-Z]+))|(?:[^a-zA-Z']+)", md.text))
-        misspelled = words - SpellCheck.dictionary
-        misspelled.discard('')
-        if len(misspelled):
-            misspellings = "\n".join([ms for ms in misspelled])
-            SpellCheck.supplemental.error(f"{misspellings}", md)
-            # md.error(f"Spelling Errors: {pprint.pformat(misspelled)}")
+        misspelled = SpellCheck.dictionary.misspelled(md.text, code=True)
+        if misspelled:
+            SpellCheck.supplemental.error("\n".join(misspelled), md)
+            for ms in misspelled:
+                suggestions = SpellCheck.dictionary.suggest(ms)
+                if suggestions:
+                    md.error(f"Misspelled {ms}: did you mean {', '.join(suggestions)}?")
 
 
 class HangingHyphens(Validator):
@@ -434,12 +904,12 @@ class HangingHyphens(Validator):
     hanging_hyphen = re.compile("[^-]+-$")
 
     def validate(self, md: MarkdownFile):
-        for line in md.lines:
+        for n, line in enumerate(md.lines):
             line = line.rstrip()
             if HangingHyphens.hanging_emdash.match(line):
-                md.error(f"Hanging emdash: {line}")
+                md.error(f"Hanging emdash: {line}", n)
             if HangingHyphens.hanging_hyphen.match(line):
-                md.error(f"Hanging hyphen: {line}")
+                md.error(f"Hanging hyphen: {line}", n)
 
 
 class FunctionDescriptions(Validator):
@@ -450,19 +920,22 @@ class FunctionDescriptions(Validator):
 
     def validate(self, md: MarkdownFile):
         func_descriptions = \
-            re.findall(r"`[^(`]+?`\s+function", md.text) + \
-            re.findall(r"function\s+`[^(`]+?`", md.text)
+            list(re.finditer(r"`[^(`]+?`\s+function", md.text)) + \
+            list(re.finditer(r"function\s+`[^(`]+?`", md.text))
         if func_descriptions:
             err_msg = None
-            for f in func_descriptions:
-                if f not in FunctionDescriptions.exclude:
+            first_line = None
+            for match in func_descriptions:
+                f = match.group(0)
+                if not FunctionDescriptions.exclude.excludes(f, md):
                     if not err_msg:
                         err_msg = "Function descriptions missing '()':\n"
+                        first_line = md.line_of(match.start())
                     f = f.replace("\n", " ").strip()
                     err_msg += f"\t{f}\n"
                     FunctionDescriptions.exclude.error(f"{f}", md)
             if err_msg:
-                md.error(err_msg.strip())
+                md.error(err_msg.strip(), first_line)
 
 
 class PunctuationInsideQuotes:  # (Validator):
@@ -470,8 +943,7 @@ class PunctuationInsideQuotes:  # (Validator):
     command_name = "punctuation_in_quotes"
 
     def validate(self, md: MarkdownFile):
-        text = re.sub("```(.*?)\n(.*?)\n```", "", md.text, flags=re.DOTALL)
-        text = re.sub("`.*?`", "", text, flags=re.DOTALL)
+        text = re.sub("`.*?`", "", md.prose, flags=re.DOTALL)
         punctuation_outside = [line for line in text.splitlines()
                                if line.find('",') != -1 or line.find('".') != -1]
         if punctuation_outside:
@@ -489,7 +961,7 @@ class PrintlnOutput(Validator):
     def validate(self, md: MarkdownFile):
         for listing in md.listings:
             if "println" in listing.code and not any([ok in listing.code for ok in PrintlnOutput.OK]):
-                if listing.slug in PrintlnOutput.exclude:
+                if PrintlnOutput.exclude.excludes(listing.slug, md):
                     continue  # Next listing
                 md.error(
                     f"println without /* Output:\n{listing.slug}\n", listing.md_starting_line)
@@ -516,26 +988,31 @@ class CapitalizedComments(Validator):
         n = 0
         while n < len(lines):
             if "//" in lines[n]:
+                first = n
                 n, block = CapitalizedComments.parse_comment_block(n, lines)
-                result.append(block)
+                result.append((first, block))
             else:
                 n += 1
         return result
 
     @staticmethod
     def find_uncapitalized_comment(md: MarkdownFile):
-        """Need to add checks for '.' and following cap"""
+        """
+        Returns the comment and its line number in md.
+        Need to add checks for '.' and following cap
+        """
         for listing in md.listings:
-            for comment_block in CapitalizedComments.parse_blocks_of_comments(listing):
+            for n, comment_block in CapitalizedComments.parse_blocks_of_comments(listing):
                 first_char = comment_block.strip()[0]
                 if first_char.isalpha() and not first_char.isupper():
-                    return comment_block.strip()
-        return False
+                    # Line numbers in comment blocks don't include the slugline:
+                    return comment_block.strip(), listing.md_starting_line + 1 + n
+        return False, None
 
     def validate(self, md: MarkdownFile):
-        uncapped = CapitalizedComments.find_uncapitalized_comment(md)
-        if uncapped and uncapped not in CapitalizedComments.exclude:
-            md.error(f"Uncapitalized comment: {uncapped}")
+        uncapped, line_number = CapitalizedComments.find_uncapitalized_comment(md)
+        if uncapped and not CapitalizedComments.exclude.excludes(uncapped, md):
+            md.error(f"Uncapitalized comment: {uncapped}", line_number)
             CapitalizedComments.exclude.error(f"{uncapped}", md)
 
 
@@ -572,24 +1049,29 @@ class ListingIndentation(Validator):
 
     @staticmethod
     def find_inconsistent_indentation(md: MarkdownFile):
+        """Returns the problem and the line number of its listing"""
         for listing in md.listings:
             inconsistent = ListingIndentation.inconsistent_indentation(listing)
             if inconsistent:
-                return inconsistent
-        return False
+                return inconsistent, listing.md_starting_line
+        return False, None
 
     def validate(self, md: MarkdownFile):
-        bad_indent = ListingIndentation.find_inconsistent_indentation(md)
+        bad_indent, line_number = ListingIndentation.find_inconsistent_indentation(md)
         if bad_indent:
-            md.error(f"Inconsistent indentation: {bad_indent}")
+            md.error(f"Inconsistent indentation: {bad_indent}", line_number)
 
 
 class TickedWords(Validator):
     """Spell-check single-ticked items against compiled code"""
     command_name = "ticked_words"
 
-    exclude = Exclusions("valid_ticked_words.txt")
+    exclude = Exclusions("valid_ticked_words.txt", book_wide=True)
     non_letters = re.compile("[^a-zA-Z]+")
+    index = lazy(lambda: project_index().symbols())
+
+    def global_inputs(self):
+        return TickedWords.index.digest
 
     def validate(self, md: MarkdownFile):
 
@@ -597,39 +1079,28 @@ class TickedWords(Validator):
             if id in self.trace:
                 print(f"{md} -> {description}: {pprint.pformat(item)}")
 
-        stripped_listings = [TickedWords.non_letters.split(listing.no_comments)
-                             for listing in md.listings]
-        trace('a', "stripped_listings", stripped_listings)
-        # Flatten list
-        pieces = {item for sublist in stripped_listings for item in sublist}
-        trace('b', "pieces", pieces)
-        pieces = pieces.union(TickedWords.exclude)
-        raw_single_ticks = set(
-            t for t in re.findall("`.+?`", md.text, flags=re.DOTALL) if t != "```"
-        )
-        trace('c', "raw_single_ticks", raw_single_ticks)
-        single_ticks = [TickedWords.non_letters.sub(" ", t[1:-1]).split()
-                        for t in raw_single_ticks]
-        # Flatten list
-        single_ticks = {item for sublist in single_ticks for item in sublist}
-        trace('d', "single_ticks", single_ticks)
-        not_in_examples = single_ticks.difference(pieces).difference(TickedWords.exclude.set)
+        raw_single_ticks = [
+            m for m in re.finditer("`.+?`", md.text, flags=re.DOTALL) if m.group(0) != "```"
+        ]
+        trace('c', "raw_single_ticks", {m.group(0) for m in raw_single_ticks})
+        # Where each word first appears in single ticks:
+        single_ticks = {}
+        for m in raw_single_ticks:
+            for word in TickedWords.non_letters.sub(" ", m.group(0)[1:-1]).split():
+                single_ticks.setdefault(word, m.start())
+        trace('d', "single_ticks", set(single_ticks))
+        trace('e', "defined_in", {word: TickedWords.index.defined_in(word)
+                                  for word in single_ticks})
+        not_in_examples = sorted(word for word in single_ticks
+                                 if word not in TickedWords.index
+                                 and not TickedWords.exclude.excludes(word, md))
         if not_in_examples:
-            e = next(iter(not_in_examples))  # Select any element from the set
-            for n, line in enumerate(md.lines):
-                if '`' in line and e in line:
-                    break
-            formatted_result = "\n".join([s.strip() for s in not_in_examples])
+            n = md.line_of(min(single_ticks[e] for e in not_in_examples))
+            formatted_result = "\n".join(not_in_examples)
             md.error(
                 f"Backticked word(s) not in examples: {formatted_result}", n)
-            TickedWords.exclude.error(formatted_result, md)
-
-
-def title_set():
-    result = set()
-    for md in config.markdown_dir.glob("*.md"):
-        result.add(md.read_text().splitlines()[0].strip())
-    return result
+            for word in not_in_examples:
+                TickedWords.exclude.error(word, md)
 
 
 class CrossLinks(Validator):
@@ -639,7 +1110,10 @@ class CrossLinks(Validator):
     explicit_link = re.compile(r"\[[^]]+?\]\([^)]+?\)", flags=re.DOTALL)
     cross_link = re.compile(r"\[.*?\]", flags=re.DOTALL)
     footnote = re.compile(r"\[\^[^]]+?\]", flags=re.DOTALL)
-    titles = title_set()
+    index = lazy(lambda: project_index().crosslinks())
+
+    def global_inputs(self):
+        return CrossLinks.index.titles()
 
     def validate(self, md: MarkdownFile):
         explicits = [e.replace("\n", " ")
@@ -663,10 +1137,11 @@ class CrossLinks(Validator):
             if any([ch in c for ch in """,<'"()$%/"""]):
                 continue
             cross_links.append(c)
-        unresolved = [cl for cl in cross_links if cl not in CrossLinks.titles]
+        unresolved = [cl for cl in cross_links if cl not in CrossLinks.index]
         if unresolved:
+            first = md.text.find(f"[{unresolved[0]}]")
             md.error(f"""Unresolved cross-links:
-            {pprint.pformat(unresolved)}""")
+            {pprint.pformat(unresolved)}""", md.line_of(first) if first != -1 else None)
 
 
 class MistakenBackquotes(Validator):
@@ -675,16 +1150,20 @@ class MistakenBackquotes(Validator):
     exclude = Exclusions("mistaken_backquotes.txt")
 
     def validate(self, md: MarkdownFile):
-        lines = md.prose.splitlines()
-        for n, line in enumerate(lines):
-            if n + 1 >= len(lines):
+        lines = md.prose_lines
+        for i, (n, line) in enumerate(lines):
+            if i + 1 >= len(lines):
                 break
-            if line.startswith("`") and lines[n + 1].startswith("`"):
-                if line in MistakenBackquotes.exclude and lines[n + 1] in MistakenBackquotes.exclude:
+            next_line = lines[i + 1][1]
+            if line.startswith("`") and next_line.startswith("`"):
+                if (MistakenBackquotes.exclude.excludes(line, md)
+                        and MistakenBackquotes.exclude.excludes(next_line, md)):
                     continue
                 md.error(
-                    f"{config.msgbreak}\nPotential backquote error on line {n}:\n{line}\n{lines[n + 1]}\n")
-                MistakenBackquotes.exclude.error(md.err_msg, md)
+                    f"{config.msgbreak}\nPotential backquote error on line {n}:\n{line}\n{next_line}\n",
+                    n)
+                MistakenBackquotes.exclude.error(line, md)
+                MistakenBackquotes.exclude.error(next_line, md)
 
 
 class JavaPackageDirectory(Validator):
@@ -743,26 +1222,26 @@ class DuplicateExampleNames(Validator):
     Example names can't be duplicated
     """
     command_name = "duplicate_example_names"
-    all_examples = config.data_path / "AllExampleNames.txt"
-    all_examples.write_text("")  # Clear file during class construction
 
     def validate(self, md: MarkdownFile):
-        with open(DuplicateExampleNames.all_examples, "a") as aa:
-            for example in md.listings:
-                if example.proper_slugline:
-                    aa.write(f"{example.slug[3:]}\n")
+        pass  # Duplicates are found across the whole book, in post_process()
 
     def post_process(self):
-        examples = DuplicateExampleNames.all_examples.read_text().splitlines()
-        duplicates = set([x for x in examples if examples.count(x) > 1])
-        if duplicates:
-            print(
-                f"Duplicate example sluglines:\n{pprint.pformat(duplicates)}")
-        example_names = [e.split('/')[-1] for e in examples]
-        dupnames = set(
-            [x for x in example_names if example_names.count(x) > 1])
-        if dupnames:
-            print(f"Duplicate example names:\n{pprint.pformat(dupnames)}")
+        sluglines = project_index().example_sluglines()
+        names = sluglines.by(lambda slug: slug.split('/')[-1])
+        print(sluglines.report("Duplicate example sluglines"), end="")
+        print(names.report("Duplicate example names"), end="")
+        found = []
+        for heading, index in [("Duplicate example slugline", sluglines),
+                               ("Duplicate example name", names)]:
+            for name, locations in index.duplicates().items():
+                for location in locations:
+                    atom_name, line = location.rsplit(":", 1)
+                    found.append(findings.Finding(
+                        self.name(), atom_name, int(line), None, self.severity,
+                        f"{heading}: {name}, also at "
+                        f"{', '.join(loc for loc in locations if loc != location)}", False))
+        return found
 
 
 class PackageAndDirectoryNames(Validator):
@@ -775,7 +1254,8 @@ class PackageAndDirectoryNames(Validator):
     def validate(self, md: MarkdownFile):
         for lst in md.listings:
             if lst.directory and lst.package and lst.package != lst.directory.lower():
-                if "soln" not in lst.package and lst.package not in PackageAndDirectoryNames.exclude:
+                if ("soln" not in lst.package
+                        and not PackageAndDirectoryNames.exclude.excludes(lst.package, md)):
                     PackageAndDirectoryNames.exclude.error(lst.package, md)
                     md.error(textwrap.dedent(f"""\
                         Inconsistent package/directory name:
@@ -791,17 +1271,21 @@ class DirectoryNameConsistency(Validator):
     dirname_exclude = Exclusions("directory_names.txt")
 
     def validate(self, md: MarkdownFile):
-        dirset = ({lst.directory for lst in md.listings if lst.directory}
-                  - DirectoryNameConsistency.exclude.set)
+        dirset = {lst.directory for lst in md.listings if lst.directory
+                  and not DirectoryNameConsistency.exclude.excludes(lst.directory, md)}
+        first_line = next((lst.md_starting_line for lst in md.listings
+                           if lst.directory in dirset), None)
         if len(dirset) > 1:
-            DirectoryNameConsistency.exclude.error(dirset, md)
+            for directory in sorted(dirset):
+                DirectoryNameConsistency.exclude.error(directory, md)
             md.error(
-                f"Multiple directory names in one atom: {pprint.pformat(dirset)}")
-        if dirset - DirectoryNameConsistency.dirname_exclude.set:
+                f"Multiple directory names in one atom: {pprint.pformat(dirset)}", first_line)
+        if any(not DirectoryNameConsistency.dirname_exclude.excludes(directory, md)
+               for directory in dirset):
             calculated_dir = "".join([w.capitalize()
                                       for w in md.path.name[4:-3].split("_")])
             if calculated_dir not in dirset:
-                DirectoryNameConsistency.dirname_exclude.error(
-                    f"{calculated_dir} -> {dirset}", md)
+                for directory in sorted(dirset):
+                    DirectoryNameConsistency.dirname_exclude.error(directory, md)
                 md.error(
-                    f"Inconsistent directory name: {calculated_dir} -> {dirset}")
+                    f"Inconsistent directory name: {calculated_dir} -> {dirset}", first_line)
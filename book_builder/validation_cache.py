@@ -0,0 +1,70 @@
+"""
+Persistent cache of validation results, so unchanged atoms can be skipped.
+Each entry holds the result of running one Validator on one atom, along with
+a key hashed from everything that result depends on: the atom's contents,
+the validator, its data/exclusion files and any global inputs.
+"""
+import hashlib
+import json
+
+import book_builder.config as config
+import book_builder.data_files as data_files
+
+
+def digest(*parts):
+    """sha256 of all parts, each converted to a string"""
+    hasher = hashlib.sha256()
+    for part in parts:
+        hasher.update(str(part).encode("utf-8"))
+        hasher.update(b"\0")
+    return hasher.hexdigest()
+
+
+class ValidationCache:
+    """
+    Entries are stored under "atom_name:ValidatorName" so each atom/validator
+    pair keeps only its most recent result.
+    """
+    path = config.data_path / "validation_cache.json"
+
+    def __init__(self, entries=None):
+        self.entries = entries if entries is not None else {}
+        self.changed = False
+
+    @classmethod
+    def load(cls):
+        if not cls.path.exists():
+            return cls()
+        try:
+            return cls(json.loads(cls.path.read_text()))
+        except ValueError:
+            print(f"Ignoring corrupt {cls.path.name}")
+            return cls()
+
+    def lookup(self, atom_name, validator_name, key):
+        """Returns the cached result, or None if it's missing or out of date"""
+        entry = self.entries.get(f"{atom_name}:{validator_name}")
+        if entry and entry["key"] == key:
+            return entry["result"]
+        return None
+
+    def store(self, atom_name, validator_name, key, result):
+        self.entries[f"{atom_name}:{validator_name}"] = {"key": key, "result": result}
+        self.changed = True
+
+    def save(self, atom_names):
+        """Drop entries for atoms that no longer exist, then write the cache"""
+        for entry_name in list(self.entries):
+            if entry_name.split(":")[0] not in atom_names:
+                del self.entries[entry_name]
+                self.changed = True
+        if not self.changed:
+            return
+        data_files.replace(self.path, json.dumps(self.entries))
+        self.changed = False
+
+    @classmethod
+    def clear(cls):
+        if cls.path.exists():
+            cls.path.unlink()
+        return f"Removed {cls.path}"
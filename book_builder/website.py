@@ -1,7 +1,8 @@
 import re
 import shutil
-import os
 import book_builder.config as config
+import book_builder.profiling as profiling
+from book_builder.corpus import Corpus
 from book_builder.util import pushd
 
 website_repo = config.root_path.parent / "AtomicKotlin-hugo"
@@ -15,10 +16,9 @@ def create_website_toc():
     highlight = "***"
     if not config.markdown_dir.exists():
         raise Exception(f"Cannot find {config.markdown_dir}")
-    for md in config.markdown_dir.glob("*.md"):
-        text = md.read_text()
-        lines = text.splitlines()
-        first = lines[0]
+    for atom in Corpus.of().atoms():
+        text = atom.text
+        first = atom.lines[0]
         if "Copyright" in first:
             continue
         tag = '##' if first.startswith('-#') else '- '
@@ -60,5 +60,5 @@ def git_commit_website():
     Commit current website version to github repo
     """
     with pushd(website_repo):
-        os.system(f"""git commit -a -m "auto-update from book" """)
-        os.system("git push")
+        profiling.system(f"""git commit -a -m "auto-update from book" """)
+        profiling.system("git push")
@@ -5,12 +5,16 @@ import os
 import pprint
 import re
 from itertools import filterfalse
-from PIL import Image
 
 import book_builder.config as config
+import book_builder.markdown_tokens as tokens
+from book_builder.corpus import Corpus
+from book_builder.crosslinks import CrossLinkIndex, generate_crosslink_tag
+from book_builder.symbols import SymbolIndex
 
 
 def display_image_resolutions():
+    from PIL import Image  # Optional, and slow to import
     images = config.markdown_dir / "images"
     print(images)
     for md in images.rglob("*"):
@@ -21,8 +25,6 @@ def display_image_resolutions():
 
 
 class CodeCheckListing:
-    slugline = re.compile("^(//|#) .+?\.[a-z]+$", re.MULTILINE)
-
     def __init__(self, code_block: str):
         def remove(block: str, pattern: str) -> str:
             return re.sub(pattern, '', block, flags=re.DOTALL)
@@ -32,7 +34,7 @@ class CodeCheckListing:
         self.code = remove(self.code, r'""".*?"""')
         self.lines = self.code.splitlines()
         self.title = self.lines[0]
-        self.is_listing = CodeCheckListing.slugline.match(self.title)
+        self.is_listing = tokens.slugline.match(self.title)
         if not self.is_listing:
             return
         first_blank = self.lines.index("")
@@ -68,24 +70,24 @@ def check_package_consistency():
     results = []
     files = set()
     found_packages = False
-    for md in config.markdown_dir.glob("*.md"):
+    for md in Corpus.of().atoms():
         if not found_packages and "Packages" not in md.name:
             continue
         if "Packages" in md.name:
             found_packages = True
             continue
-        for group in re.findall("```(.*?)\n(.*?)\n```", md.read_text(), flags=re.DOTALL):
-            ccl = CodeCheckListing(group[1])
+        for listing in md.listings:
+            ccl = CodeCheckListing(listing.code)
             if not ccl.is_listing:
                 continue
             if ccl.definitions and not ccl.package:
                 ccl.display("No Package")
                 results.append([md.name, ccl.title])
-                files.add(md)
+                files.add(md.path)
             if ccl.main and ccl.package and not ccl.definitions:
                 ccl.display("Package but only main")
                 results.append([md.name, ccl.title])
-                files.add(md)
+                files.add(md.path)
     pprint.pprint(results)
     for file in files:
         print(f"subl {file}")
@@ -94,21 +96,24 @@ def find_missing_listing_header():
     """
     Look for missing ```kotlin
     """
-    for md in config.markdown_dir.glob("*.md"):
-        lines = md.read_text().splitlines()
-        for n, line in enumerate(lines):
-            if (
-                    line.startswith("//")
-                    and line.endswith(".kt")
-                    and not lines[n - 1].startswith("```kotlin")
-            ):
-                print(f"{md.name}: {line}")
+    for md in Corpus.of().atoms():
+        # A slugline outside a listing is missing its marker:
+        for prose in md.spans_of(tokens.PROSE):
+            for line in prose.text.splitlines():
+                if line.startswith("//") and line.endswith(".kt"):
+                    print(f"{md.name}: {line}")
+        # A listing that doesn't start with ```kotlin:
+        for listing in md.listings:
+            slug = listing.code.split("\n", 1)[0]
+            if slug.startswith("//") and slug.endswith(".kt") and \
+                    not listing.marker.startswith("```kotlin"):
+                print(f"{md.name}: {slug}")
 
 
 def check_kotlin_usage():
     kt = re.compile("\s+kotlin[^.]")
-    for md in config.markdown_dir.glob("*.md"):
-        for line in md.read_text().splitlines():
+    for md in Corpus.of().atoms():
+        for line in md.lines:
             if kt.search(line):
                 # if line.startswith("import "):
                 #     continue
@@ -116,35 +121,29 @@ def check_kotlin_usage():
 
 
 def find_imports_and_packages():
-    all_imports = set()
-    all_packages = set()
-    for md in config.markdown_dir.glob("*.md"):
-        for line in md.read_text().splitlines():
-            if line.startswith("import "):
-                all_imports.add(line)
-            if line.startswith("package "):
-                all_packages.add(line)
-    pprint.pprint(all_imports)
-    pprint.pprint(all_packages)
+    index = SymbolIndex.of()
+    for statements in (index.imports, index.packages):
+        for statement in sorted(statements):
+            print(f"{statement}  [{', '.join(sorted(statements[statement]))}]")
 
 
 def find_classes():
-    slugline = re.compile("^(//|#) .+?\.[a-z]+$", re.MULTILINE)
-    inside = False
-    for md in config.markdown_dir.glob("*.md"):
-        for group in re.findall("```(.*?)\n(.*?)\n```", md.read_text(), re.DOTALL):
-            listing = group[1].splitlines()
-            title = listing[0]
-            if slugline.match(title):
-                for line in listing:
-                    if inside:
-                        print(line)
-                        if line.startswith("}"):
-                            inside = False
-                    if line.startswith("class") and line.endswith("{"):
-                        print(title)
-                        print(line)
-                        inside = True
+    declarations = SymbolIndex.of().declarations.values()
+    for declared in sorted((d for ds in declarations for d in ds), key=lambda d: d.atom):
+        if declared.kind == "class" and declared.slug and "\n" in declared.block:
+            print(declared.slug)
+            print(declared.block)
+
+
+def find_symbol(name):
+    index = SymbolIndex.of()
+    for declared in index.declarations.get(name, ()):
+        print(f"{declared.atom}: {declared.slug or '(fragment)'}")
+        print(f"    {declared.block.splitlines()[0].strip()}")
+    if name in index:
+        print(f"Used in: {', '.join(sorted(index.identifiers[name]))}")
+    else:
+        print(f"{name} isn't in any listing")
 
 
 def check_exercise_count():
@@ -155,52 +154,46 @@ def check_exercise_count():
         "_Appendices.md",
         "_Appendix_",
     ]
-    for md in config.markdown_dir.glob("*.md"):
+    for md in Corpus.of().atoms():
         if any(ex in md.name for ex in exclusions):
             continue
-        text = md.read_text()
+        headers = {header.text.strip()
+                   for header in md.spans_of(tokens.HEADER)}
         for n in [1, 2, 3]:
-            if f"##### Exercise {n}" not in text:
+            if f"##### Exercise {n}" not in headers:
                 print(f"{md.name} Missing Exercise {n}")
 
 
-def generate_crosslink_tag(atom_title):
-    atom_title = re.sub(r"\s+", " ", atom_title)
-    title = re.sub('[`:!,()]', '', atom_title)
-    title = title.replace('&', 'and')
-    title = title.replace(' ', '-')
-    return title.lower()
-
-
 def fix_crosslink_references():
-    for md in config.markdown_dir.glob("*.md"):
+    index = CrossLinkIndex.of()
+    candidate = re.compile(r"(?<=\s)\[[A-Z`][^],[]+?\](?=[^(:])")
+    for md in Corpus.of().atoms():
         if md.name == "098_Appendix_B_Java_Interoperability.md":
             continue
-        text = md.read_text()
-        crosslinks = set(re.findall(r"\s(\[[A-Z`][^,]+?\])[^(:]", text)) - {"[Error]"}
-        if crosslinks:
+        fixed = []
+
+        def fix(match):
+            target = index.resolve(match.group(0)[1:-1])
+            if match.group(0) == "[Error]" or not target:
+                return match.group(0)
+            fixed.append(f"{match.group(0)}({target.href()})")
+            return fixed[-1]
+
+        text = candidate.sub(fix, md.text)
+        if fixed:
             print(f"\n{md.name}")
-            for cl in crosslinks:
-                fixed_tag = f"{cl}(#{generate_crosslink_tag(cl[1:-1])})"
+            for fixed_tag in fixed:
                 print(fixed_tag)
-            md.write_text(text.replace(cl, fixed_tag))
+            md.path.write_text(text)
 
 
 def check_crosslink_references():
-    targets = set()
-    all: str = ""
-    for md in config.markdown_dir.glob("*.md"):
-        text = md.read_text()
-        all += text
-        target: str = re.findall(r"#\s+.+?{(#.+?)}", text)[0]
-        targets.add(target)
-    pprint.pprint(targets)
-
-    references = re.findall(r"\[.+?\]\((#.+?)\)", all)
-    pprint.pprint(references)
-    for ref in references:
-        if ref not in targets:
-            print(f"-> {ref}")
+    """Explicit cross-links to anchors that no atom defines"""
+    index = CrossLinkIndex.of()
+    for md in Corpus.of().atoms():
+        for text, anchor, target in index.explicit_links(md.text):
+            if not target:
+                print(f"{md.name}: [{text}] -> #{anchor}")
 
     # candidates = filter_items(set(re.findall(r"\[.+?\][^(]", text)))
     # if candidates:
@@ -20,6 +20,7 @@ setup(
     entry_points='''
         [console_scripts]
         bb=book_builder.scripts.book_builder:cli
+        bbc=book_builder.client:main
         generate=book_builder.scripts.generate_output:generate
     ''',
 )
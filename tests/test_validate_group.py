@@ -0,0 +1,41 @@
+"""
+The 'bb validate' group's options must not outlive the command they were
+given with, since 'bb serve' runs every bbc command in one process.
+"""
+import os
+import tempfile
+from pathlib import Path
+
+# book_builder.config loads the book from BOOK_PROJECT_HOME at import:
+book = Path(tempfile.mkdtemp(prefix="bb_test_"))
+(book / "Markdown").mkdir()
+(book / "data").mkdir()
+(book / "configuration.py").write_text(
+    "from pathlib import Path\n"
+    "title = 'Test'\nbase_name = 'Test'\nlanguage_name = 'kotlin'\ncode_ext = 'kt'\n"
+    "code_width = 47\nstart_comment = '//'\n"
+    f"extracted_examples = Path({str(book / 'extracted')!r})\n")
+os.environ.setdefault("BOOK_PROJECT_HOME", str(book))
+os.environ.setdefault("MD_EDITOR", "true")
+os.environ.setdefault("CODE_EDITOR", "true")
+
+import click
+from click.testing import CliRunner
+
+import book_builder.validate as _validate
+from book_builder.scripts.book_builder import cli, validate
+
+
+def test_changed_atoms_are_reset_by_the_next_command(monkeypatch):
+    staged = [Path("001_Staged.md")]
+    monkeypatch.setattr(_validate, "changed_atoms", lambda ref, staged_only: staged)
+    seen = []
+    validate.add_command(click.Command(
+        "probe", callback=click.pass_obj(lambda options: seen.append(options["changed"]))))
+    try:
+        runner = CliRunner()
+        assert runner.invoke(cli, ["validate", "--staged", "probe"]).exit_code == 0
+        assert runner.invoke(cli, ["validate", "probe"]).exit_code == 0
+    finally:
+        del validate.commands["probe"]
+    assert seen == [staged, None]